@@ -15,9 +15,24 @@ try:
     import auth_utils
     import setup_auth
     import os
-    import glob
     import sync_data
+    import sync_telemetry
+    import sync_coordinator
+    import data_store
+    import icons
+    import metrics
+    import charts
+    import ranges
+    import dataset
+    import export
+    import data_watch
+    import threading
+    import time
     import traceback
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    except ImportError:  # Older Streamlit: caches still fill, just with context warnings
+        add_script_run_ctx = get_script_run_ctx = None
 except Exception as e:
     st.error(f"🚨 Critical Import Error: {e}")
     # We might need traceback here too if it exists in base python
@@ -32,6 +47,10 @@ if not os.path.exists(ASSETS_DIR):
 
 DRIVE_FOLDER_NAME = "data app NPK"
 
+# Cold start: fetch users.csv first, then only the logged-in grower's files,
+# and backfill everyone else in the background (instead of a full sync up front)
+LAZY_FETCH = True
+
 # --- TRANSLATIONS (Ported from R) ---
 TRANSLATIONS = {
     "en": {
@@ -60,8 +79,6 @@ TRANSLATIONS = {
         "kpi_target": "Target",
         "kpi_total": "Total Samples",
         "kpi_selected": "Selected",
-        "plot_optimal": "Optimal",
-        "plot_out_range": "Out of Range",
         "plot_min": "Min",
         "plot_max": "Max",
         "trend_selector": "Select Plot for Trends:",
@@ -101,8 +118,6 @@ TRANSLATIONS = {
         "kpi_target": "יעד",
         "kpi_total": "סה״כ דגימות",
         "kpi_selected": "נבחרו",
-        "plot_optimal": "מיטבי",
-        "plot_out_range": "חריגה",
         "plot_min": "מינימום",
         "plot_max": "מקסימום",
         "trend_selector": "בחר חלקה:",
@@ -144,11 +159,24 @@ CROP_NAMES = {
 
 # --- DATA LOADING ---
 # --- DATA LOADING ---
-@st.cache_data(ttl=600)
-def load_data():
-    DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+@st.cache_resource
+def get_data_watcher():
+    """One watcher per process on data/; its generation replaces a fixed cache TTL."""
+    return data_watch.DataWatcher(data_store.DATA_DIR)
+
+
+def data_generation():
+    return get_data_watcher().generation
+
+
+# No TTL: `generation` changes when data/ changes, which keys a fresh entry
+@st.cache_data(max_entries=4)
+def load_users(data_version=None, generation=0):
+    # Read one published snapshot (the version pins the directory, so a sync
+    # publishing mid-read can't mix files)
+    DATA_DIR = data_store.snapshot_dir(data_version)
     if not os.path.exists(DATA_DIR):
-        return pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame()
 
     # Load Users
     users_path = os.path.join(DATA_DIR, 'users.csv')
@@ -164,37 +192,171 @@ def load_data():
         st.error(f"Could not load user database. 'users.csv' not found in {DATA_DIR}.")
         st.write(f"Files found in data folder: {files_in_data}")
 
-    # Load Data
-    all_files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    data_frames = []
-    
-    for f in all_files:
-        if 'users.csv' in f: continue
+    return users_df
+
+
+# cache_resource, not cache_data: every session gets the same object instead of
+# its own unpickled copy. It is shared, so nothing may modify it in place.
+@st.cache_resource(max_entries=2)
+def load_samples(data_version=None, generation=0):
+    """Shared, read-only dataset.SampleSet of one snapshot (unchanged files are not re-parsed)."""
+    DATA_DIR = data_store.snapshot_dir(data_version)
+    if not os.path.exists(DATA_DIR):
+        return dataset.SampleSet(pd.DataFrame())
+    sample_set = dataset.read_snapshot(DATA_DIR, data_store.read_manifest(data_version) if data_version else None)
+    get_data_watcher().refreshed(generation)
+    return sample_set
+
+# Aggregates are shared by every session; bound how many selections are kept
+AGG_CACHE_ENTRIES = 256
+
+# The cached helpers below take the SampleSet as `_samples` (leading underscore:
+# not hashed) and are keyed by the grower's data fingerprint instead of the data
+# version, so a sync that didn't touch a grower's files keeps their entries warm.
+# Entries of old fingerprints simply age out of the bounded caches.
+
+
+@st.cache_resource(max_entries=AGG_CACHE_ENTRIES, show_spinner=False)
+def load_slice_index(_samples, fingerprint, user, crop):
+    """Integer date/site codes of a (user, crop) slice (read-only, shared by all sessions)."""
+    return metrics.build_slice_index(_samples.slice(user, crop))
+
+
+@st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False)
+def load_kpis(_samples, fingerprint, user, crop, dates=None):
+    """KPI values for (user, crop, date codes). dates=None means all dates."""
+    crop_df = _samples.slice(user, crop)
+    index = load_slice_index(_samples, fingerprint, user, crop)
+    return metrics.kpis(metrics.select_dates(crop_df, index, dates))
+
+
+@st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False)
+def load_trend(_samples, fingerprint, user, crop, site=None):
+    """Daily N/P/K means for (user, crop, optional site)."""
+    crop_df = _samples.slice(user, crop)
+    return metrics.daily_means(crop_df, load_slice_index(_samples, fingerprint, user, crop), site)
+
+
+# Raw data table
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
+# Internal columns not shown in the raw table
+TABLE_HIDDEN_COLUMNS = ranges.STATUS_COLUMNS + ['date_fmt']
+
+
+def _table_source(_samples, fingerprint, user, crop, dates=None):
+    index = load_slice_index(_samples, fingerprint, user, crop)
+    return metrics.select_dates(_samples.slice(user, crop), index, dates)
+
+
+@st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False)
+def load_table_order(_samples, fingerprint, user, crop, dates=None, sort_by=None, ascending=True, query=None):
+    """Filtered + sorted row positions of the raw table; paging through them reuses this."""
+    return metrics.table_order(_table_source(_samples, fingerprint, user, crop, dates), sort_by, ascending, query)
+
+
+@st.cache_data(max_entries=AGG_CACHE_ENTRIES, show_spinner=False)
+def load_table_page(_samples, fingerprint, user, crop, dates=None, sort_by=None, ascending=True, query=None, page=1, page_size=TABLE_PAGE_SIZES[0]):
+    """One page of the raw table: only these rows are serialized to the browser."""
+    order = load_table_order(_samples, fingerprint, user, crop, dates, sort_by, ascending, query)
+    start = (page - 1) * page_size
+    df = _table_source(_samples, fingerprint, user, crop, dates)
+    page_df = df.iloc[order[start:start + page_size]]
+    return page_df.drop(columns=[c for c in TABLE_HIDDEN_COLUMNS if c in page_df.columns])
+
+
+def prepare_export(sample_set, fingerprint, data_version, user, crop, dates=None, fmt='csv'):
+    """Writes (once per data version and selection) the samples + trends export files. Returns their paths."""
+    samples_path, trends_path = export.selection_paths(data_version, user, crop, dates, fmt)
+    if not (os.path.exists(samples_path) and os.path.exists(trends_path)):
+        export.prune(data_version)
+        os.makedirs(os.path.dirname(samples_path), exist_ok=True)
+        samples, trends = export.export_frames(sample_set.slice(user, crop),
+                                               load_slice_index(sample_set, fingerprint, user, crop), dates)
+        export.write(samples, samples_path, fmt)
+        export.write(trends, trends_path, fmt)
+    export.touch(data_version)
+    return samples_path, trends_path
+
+
+# Figure specs (plain dicts) for the six dashboard charts
+FIGURE_CACHE_ENTRIES = 512
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def load_jitter_figure(_samples, fingerprint, user, crop, element, dates=None, highlight_site=None):
+    """Distribution chart spec, rebuilt only when one of its inputs changes."""
+    index = load_slice_index(_samples, fingerprint, user, crop)
+    rows = metrics.date_mask(index, dates)
+    # The chart carries site codes, not names; the site match uses them too
+    df = _samples.slice(user, crop)[rows].assign(site_code=index['site_codes'][rows])
+    highlight_rows = metrics.site_mask(index, highlight_site)[rows] if highlight_site else None
+    limits = _samples.crop_ranges(crop)[element]
+    fig = charts.jitter_figure(df, element, limits, index['sites'], highlight_site, highlight_rows)
+    return charts.to_spec(fig, f"jitter {user}/{crop}/{element}")
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def load_trend_figure(_samples, fingerprint, user, crop, element, site=None, clicked_date=None):
+    """Trend chart spec (daily means ignore the date filter, so dates are not part of the key)."""
+    trend_df = load_trend(_samples, fingerprint, user, crop, site)
+    limits = _samples.crop_ranges(crop)[element]
+    fig = charts.trend_figure(trend_df, element, limits, site or "Global Avg", clicked_date)
+    return charts.to_spec(fig, f"trend {user}/{crop}/{element}")
+
+def _prefetch_crops(sample_set, fingerprint, user, crops):
+    """
+    Warms the shared caches with each crop's default view (all dates, no site
+    highlighted). Arguments mirror main()'s calls exactly, so the cache keys match.
+    """
+    t_start = time.perf_counter()
+    for crop in crops:
         try:
-            df = pd.read_csv(f)
-            # Normalize columns
-            df.columns = df.columns.str.strip()
-            if 'user' in df.columns:
-                df.rename(columns={'user': 'username'}, inplace=True)
-                
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'], dayfirst=True, errors='coerce')
-            data_frames.append(df)
+            load_slice_index(sample_set, fingerprint, user, crop)
+            load_kpis(sample_set, fingerprint, user, crop, None)
+            for element in ranges.ELEMENTS:
+                load_jitter_figure(sample_set, fingerprint, user, crop, element, None, None)
+                load_trend_figure(sample_set, fingerprint, user, crop, element, None, None)
         except Exception as e:
-            print(f"Error reading {f}: {e}")
-            
-    final_df = pd.concat(data_frames, ignore_index=True) if data_frames else pd.DataFrame()
-    
-    if not final_df.empty:
-        final_df = final_df.drop_duplicates()
-        cols = ['N', 'P', 'K']
-        if all(c in final_df.columns for c in cols):
-             final_df = final_df.dropna(subset=cols)
-             
-    return users_df, final_df
+            print(f"Prefetch of {user} / {crop} failed: {e}")
+    print(f"Prefetched {len(crops)} crops for {user} in {time.perf_counter() - t_start:.2f}s")
+
+
+def start_prefetch(sample_set, fingerprint, user, crops):
+    """Runs _prefetch_crops in a background thread attached to this session's script context."""
+    thread = threading.Thread(target=_prefetch_crops, args=(sample_set, fingerprint, user, list(crops)),
+                              name=f"prefetch-{user}", daemon=True)
+    if add_script_run_ctx:
+        add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    return thread
 
 # Legacy sync_icons removed. Using sync_data.py implementation.
 
+def run_sync_with_progress(creds, username=None):
+    """
+    Runs a coordinated sync, rendering its progress events as a live bar + ETA.
+    With a username, only that grower's files are fetched (lazy cold start).
+    """
+    tracker = sync_telemetry.ProgressTracker()
+    bar = st.progress(0.0, text="Starting sync...")
+
+    def on_event(event):
+        tracker.update(event)
+        bar.progress(tracker.fraction, text=tracker.status_line())
+
+    try:
+        if username:
+            return sync_data.fetch_grower(creds, username, on_event=on_event)
+        return sync_coordinator.run_sync(creds, on_event=on_event)
+    finally:
+        bar.empty()
+
+
+@st.cache_resource
+def load_icon_index(signature):
+    """Icon name -> display path (thumbnail preferred). Rebuilt only when `signature` changes."""
+    return icons.build_icon_index(ASSETS_DIR)
+
 
 def render_crop_selection(crops, t):
     st.markdown(f"<h2 style='text-align: center; color: #1B5E20;'>{t['select_crop_title']}</h2>", unsafe_allow_html=True)
@@ -206,24 +368,18 @@ def render_crop_selection(crops, t):
     
     n_crops = len(crops)
     cols = st.columns(n_crops + 2) # +2 for side spacers
+    icon_index = load_icon_index(icons.index_signature(ASSETS_DIR))
     
     # Iterate crops and place in middle columns
     for i, crop_name in enumerate(crops):
         with cols[i+1]:
             # Use Streamlit container for card-like grouping
             with st.container(border=True):
-                # Icon
-                icon_path = os.path.join(ASSETS_DIR, f"{crop_name}.png")
-                # Try case-insensitive lookup if strict match fails
-                if not os.path.exists(icon_path):
-                     # Check for any casing
-                     for f in os.listdir(ASSETS_DIR):
-                         if f.lower() == f"{crop_name}.png".lower():
-                             icon_path = os.path.join(ASSETS_DIR, f)
-                             break
+                # Icon (case-insensitive lookup via the cached index)
+                icon_path = icon_index.get(str(crop_name).lower())
                 
-                if os.path.exists(icon_path):
-                    st.image(icon_path, width=350)
+                if icon_path:
+                    st.image(icon_path, width=icons.THUMB_SIZE)
                 else:
                     st.write("🌿") # Simple emoji placeholder if missing
                 
@@ -239,11 +395,8 @@ def render_crop_selection(crops, t):
 
 
 # --- CONSTANTS ---
-OPTIMAL_RANGES = {
-    'N': (1.6, 2.2),
-    'P': (0.06, 0.12),
-    'K': (0.6, 1.0)
-}
+# Fallback ranges; per-crop (and per-stage) ranges come from ranges.csv
+OPTIMAL_RANGES = ranges.DEFAULT_RANGES
 
 # --- LOGO RENDERER ---
 def render_logo():
@@ -512,7 +665,7 @@ def main():
 
     # --- MANUAL SYNC TRIGGER (For Cloud Deployment) ---
     # Check if data folder is valid (must have users.csv)
-    users_csv_path = os.path.join(os.path.dirname(__file__), 'data', 'users.csv')
+    users_csv_path = os.path.join(data_store.current_dir(), 'users.csv')
     
     if not os.path.exists(users_csv_path):
 
@@ -524,7 +677,12 @@ def main():
                  with st.spinner("Downloading data... this may take 1-2 minutes..."):
                      try:
                          # Now expecting a tuple (success, message)
-                         result = sync_data.sync_data(creds)
+                         if LAZY_FETCH:
+                             # Only the user list: enough to log in
+                             result = sync_data.fetch_users(creds)
+                         else:
+                             # Coordinator: joins a sync already running in another session/process
+                             result = run_sync_with_progress(creds)
                          if isinstance(result, tuple):
                              success, msg = result
                          else:
@@ -534,7 +692,7 @@ def main():
                          if success:
                              st.success(f"{msg}")
                              st.session_state['icons_synced'] = True # Assume icons also came
-                             st.cache_data.clear()
+                             # No cache clear: the new data version keys fresh entries
                              st.rerun()
                          else:
                              st.error(f"Download failed: {msg}")
@@ -579,13 +737,17 @@ def main():
         # 3. Reload/Sync
         if st.button(t['reload_btn'], use_container_width=True):
             with st.spinner("Syncing data & icons from Drive..."):
-                 success = sync_data.sync_data(creds)
+                 success, msg = run_sync_with_progress(creds)
                  if success:
                      st.success("Sync Complete!")
-                     st.cache_data.clear()
+                     # Only growers whose files changed get new cache keys
                      st.rerun()
                  else:
-                     st.error("Sync Failed. Check logs.")            
+                     st.error(f"Sync Failed: {msg}")
+        # Latest sync telemetry (written by sync_data / sync_telemetry)
+        last_sync = sync_telemetry.load_latest_summary()
+        if last_sync:
+            st.caption(f"Last sync: {sync_telemetry.format_summary(last_sync)}")
         st.markdown("---")
 
     # --- LOGIN SCREEN ---
@@ -609,7 +771,7 @@ def main():
                 if submitted:
                     # Load users to verify
                     with st.spinner("Authenticating..."):
-                       users_db, _ = load_data()
+                       users_db = load_users(data_store.current_version(), data_generation())
                     
                     if users_db is not None and not users_db.empty:
                         users_db['username'] = users_db['username'].astype(str).str.strip()
@@ -633,16 +795,28 @@ def main():
     # --- DASHBOARD ---
     
     # 1. Load Data
+    # Lazy cold start: this grower's files now, everyone else's in the background
+    if LAZY_FETCH and not data_store.is_complete() and st.session_state.get('grower_fetched') != st.session_state['user']:
+        with st.spinner("Fetching your data..."):
+            success, msg = run_sync_with_progress(creds, username=st.session_state['user'])
+        if not success:
+            st.error(f"Download failed: {msg}")
+        st.session_state['grower_fetched'] = st.session_state['user']
+        sync_data.start_backfill(creds)
+
+    data_version = data_store.current_version()
     with st.spinner("Loading Data..."):
-        _, main_data = load_data()
+        sample_set = load_samples(data_version, data_generation())
 
-    if main_data is None or main_data.empty:
+    if sample_set.empty:
          st.warning("No data found.")
          st.stop()
+
+    # Cache key for this grower's views: only changes when their files (or ranges.csv) change
+    data_fp = sample_set.fingerprint(st.session_state['user'])
          
-    # Filter by User
-    user_data = main_data[main_data['username'] == st.session_state['user']]
-    available_crops = user_data['crop'].unique().tolist()
+    # Filter by User (row positions into the shared dataset, no per-session frames)
+    available_crops = sample_set.crops(st.session_state['user'])
     
     # Filter out non-crop items
     excluded_crops = ['logo', 'icon', 'unknown', 'nan', 'none']
@@ -650,6 +824,13 @@ def main():
         c for c in available_crops 
         if str(c).lower() not in excluded_crops and pd.notna(c)
     ]
+
+    # Right after login (and again when this grower's data changes), compute every
+    # crop's default view in the background so crop switches are served from cache
+    prefetch_key = (st.session_state['user'], data_fp)
+    if st.session_state.get('prefetched') != prefetch_key:
+        st.session_state['prefetched'] = prefetch_key
+        start_prefetch(sample_set, data_fp, st.session_state['user'], available_crops)
     
     # 2. Crop Selection Screen
     if st.session_state['selected_crop'] is None:
@@ -666,12 +847,7 @@ def main():
         
     # 3. Main Dashboard (Crop Selected) - MODERN LAYOUT
     selected_crop = st.session_state['selected_crop']
-    crop_data = user_data[user_data['crop'] == selected_crop].copy()
-    
-    # Format dates
-    if 'date' in crop_data.columns:
-        crop_data['date'] = pd.to_datetime(crop_data['date'])
-        crop_data['date_fmt'] = crop_data['date'].dt.strftime('%d/%m/%y')
+    # Dates are parsed and date_fmt is derived once, in the shared dataset
 
     # --- SIDEBAR (Controls) ---
     # Append to existing sidebar
@@ -732,9 +908,10 @@ def main():
                 st.caption(f"{t['filters']}")
                 
                 # Filters
-                all_dates = sorted(crop_data['date'].unique())
-                formatted_dates = [pd.to_datetime(d).strftime('%d/%m/%y') for d in all_dates]
-                date_map = dict(zip(formatted_dates, all_dates))
+                # Date labels and codes come from the cached slice index
+                slice_index = load_slice_index(sample_set, data_fp, st.session_state['user'], selected_crop)
+                formatted_dates = slice_index['date_labels']
+                date_map = {fmt: code for code, fmt in enumerate(formatted_dates)}
                 
                 # Helper layout
                 ctrl_col1, ctrl_col2 = st.columns([2, 8])
@@ -761,26 +938,27 @@ def main():
     if not selected_dates_fmt:
         # If pills return None (when nothing selected), we might want to default to nothing or all?
         # Usually nothing.
-        filtered_df = pd.DataFrame(columns=crop_data.columns)
+        selected_codes = []
+        n_selected = 0
     else:
-        selected_timestamps = [date_map[fmt] for fmt in selected_dates_fmt]
-        filtered_df = crop_data[crop_data['date'].isin(selected_timestamps)]
+        selected_codes = [date_map[fmt] for fmt in selected_dates_fmt]
+        # Union of the selected dates' row ranges (only counted here; cached helpers read the rows)
+        n_selected = int(metrics.date_mask(slice_index, selected_codes).sum())
+    # Cache key for the aggregates (None = all dates)
+    dates_key = None if use_all_dates else tuple(sorted(selected_codes))
 
     # Update Sample Count in Top Bar (visually tricky without rerun, so we display it in KPI section or just below)
     # Actually, let's keep it simple and put it in the KPI section or a specific status bar.
 
 
     # --- KPI SECTION ---
-    if not filtered_df.empty:
-        # Calculate Metrics
-        mean_n = filtered_df['N'].mean()
-        mean_p = filtered_df['P'].mean()
-        
-        n_opt = filtered_df['N'].between(OPTIMAL_RANGES['N'][0], OPTIMAL_RANGES['N'][1])
-        p_opt = filtered_df['P'].between(OPTIMAL_RANGES['P'][0], OPTIMAL_RANGES['P'][1])
-        k_opt = filtered_df['K'].between(OPTIMAL_RANGES['K'][0], OPTIMAL_RANGES['K'][1])
-        all_opt = n_opt & p_opt & k_opt
-        pct_optimal = (all_opt.sum() / len(filtered_df)) * 100 if len(filtered_df) > 0 else 0
+    if n_selected:
+        # Calculate Metrics (memoized per data version / user / crop / dates)
+        kpi = load_kpis(sample_set, data_fp, st.session_state['user'], selected_crop, dates_key)
+        mean_n = kpi['mean_N']
+        mean_p = kpi['mean_P']
+        pct_optimal = kpi['pct_optimal']
+        crop_ranges = sample_set.crop_ranges(selected_crop)
         
         # KPI Grid
         # k_col1, k_col2, k_col3, k_col4 = st.columns(4) # Old equal columns
@@ -808,9 +986,9 @@ def main():
                 """, unsafe_allow_html=True)
 
         render_kpi(k_col1, t['kpi_optimal_pct'], f"{pct_optimal:.0f}%", t['kpi_in_range'], "🏆", progress=pct_optimal)
-        render_kpi(k_col2, f"{t['kpi_avg']} P", f"{mean_p:.3f}", f"{t['kpi_target']}: {OPTIMAL_RANGES['P'][0]}-{OPTIMAL_RANGES['P'][1]}", "🌱")
-        render_kpi(k_col3, f"{t['kpi_avg']} N", f"{mean_n:.2f}", f"{t['kpi_target']}: {OPTIMAL_RANGES['N'][0]}-{OPTIMAL_RANGES['N'][1]}", "🌿")
-        render_kpi(k_col4, t['kpi_total'], f"{len(filtered_df)}", f"{t['kpi_selected']}: {len(filtered_df)}", "📊")
+        render_kpi(k_col2, f"{t['kpi_avg']} P", f"{mean_p:.3f}", f"{t['kpi_target']}: {crop_ranges['P'][0]}-{crop_ranges['P'][1]}", "🌱")
+        render_kpi(k_col3, f"{t['kpi_avg']} N", f"{mean_n:.2f}", f"{t['kpi_target']}: {crop_ranges['N'][0]}-{crop_ranges['N'][1]}", "🌿")
+        render_kpi(k_col4, t['kpi_total'], f"{kpi['count']}", f"{t['kpi_selected']}: {kpi['count']}", "📊")
 
     
     # --- VISUALIZATIONS GRID ---
@@ -818,9 +996,7 @@ def main():
     # Helper for Plotly config
     config = {'displayModeBar': False}
 
-    if not filtered_df.empty:
-        import plotly.graph_objects as go
-        
+    if n_selected:
         # --- ROW 1: DISTRIBUTIONS ---
         st.markdown(f"### {t['dist_header']}")
         
@@ -831,99 +1007,10 @@ def main():
         if 'clicked_date' not in st.session_state:
             st.session_state['clicked_date'] = None
 
-        def plot_jitter_modern(element, limits, chart_key, highlight_site=None):
-            min_lim, max_lim = limits
-            
-            # Helper to create traces
-            def add_traces(fig, subset_df, is_highlighted, is_background):
-                if subset_df.empty: return
-
-                vals = subset_df[element]
-                dates = subset_df['date']
-                dates_fmt = subset_df['date_fmt']
-                sites = subset_df['site']
-                sample_names = subset_df['sample']
-                is_in = vals.between(min_lim, max_lim)
-                
-                # Styles
-                if is_background:
-                    opacity = 0.1
-                    size = 8
-                    color_in = '#9CA3AF' # Gray
-                    color_out = '#9CA3AF'
-                    line_width = 0
-                elif is_highlighted:
-                    opacity = 1.0
-                    size = 14
-                    color_in = '#10B981' # Green
-                    color_out = '#EF4444' # Red
-                    line_width = 2 # Bold border
-                else: # Default (No selection)
-                    opacity = 0.7
-                    size = 10
-                    color_in = '#10B981'
-                    color_out = '#EF4444'
-                    line_width = 1
-
-                # Customdata for all points [Site, Sample]
-                c_data = np.stack((sites, sample_names), axis=-1)
-
-                # Optimal Trace
-                if not vals[is_in].empty:
-                    fig.add_trace(go.Scatter(
-                        x=dates[is_in], y=vals[is_in],
-                        mode='markers',
-                        marker=dict(color=color_in, size=size, opacity=opacity, line=dict(width=line_width, color='white' if not is_background else 'transparent')), 
-                        name=t['plot_optimal'] if not is_background else None,
-                        customdata=c_data[is_in],
-                        text=dates_fmt[is_in],
-                        hovertemplate='<b>Site:</b> %{customdata[0]}<br><b>Sample:</b> %{customdata[1]}<br><b>Date:</b> %{text}<br><b>Val:</b> %{y:.2f}<extra></extra>' if not is_background else None,
-                        showlegend=not is_background and not is_highlighted # Only show legend for default view to avoid clutter
-                    ))
-                
-                # Out Trace
-                if not vals[~is_in].empty:
-                    fig.add_trace(go.Scatter(
-                        x=dates[~is_in], y=vals[~is_in],
-                        mode='markers',
-                        marker=dict(color=color_out, size=size, opacity=opacity, line=dict(width=line_width, color='white' if not is_background else 'transparent')), 
-                        name=t['plot_out_range'] if not is_background else None,
-                        customdata=c_data[~is_in],
-                        text=dates_fmt[~is_in],
-                        hovertemplate='<b>Site:</b> %{customdata[0]}<br><b>Sample:</b> %{customdata[1]}<br><b>Date:</b> %{text}<br><b>Val:</b> %{y:.2f}<extra></extra>' if not is_background else None,
-                        showlegend=not is_background and not is_highlighted
-                    ))
-
-            fig = go.Figure()
-
-            if highlight_site:
-                # 1. Plot Background (All other sites)
-                bg_df = filtered_df[filtered_df['site'] != highlight_site]
-                add_traces(fig, bg_df, is_highlighted=False, is_background=True)
-                
-                # 2. Plot Highlight (Selected site)
-                hl_df = filtered_df[filtered_df['site'] == highlight_site]
-                add_traces(fig, hl_df, is_highlighted=True, is_background=False)
-            else:
-                # Plot All Normal
-                add_traces(fig, filtered_df, is_highlighted=False, is_background=False)
-
-            # Limit Lines
-            fig.add_hline(y=min_lim, line_width=1, line_dash="dash", line_color="#10B981", opacity=0.6)
-            fig.add_hline(y=max_lim, line_width=1, line_dash="dash", line_color="#10B981", opacity=0.6)
-
-            fig.update_layout(
-                showlegend=False, # cleaner look
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                margin=dict(l=40, r=40, t=40, b=40),
-                height=320,
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                xaxis=dict(showgrid=True, gridcolor='#F3F4F6', automargin=True, tickformat='%d/%m/%y', tickangle=0),
-                yaxis=dict(showgrid=True, gridcolor='#F3F4F6', automargin=True),
-                dragmode='select', 
-                clickmode='event+select'
-            )
+        def plot_jitter_modern(element, chart_key, highlight_site=None):
+            # Figure spec is cached per (user, crop, element, dates, highlight, version)
+            fig = load_jitter_figure(sample_set, data_fp, st.session_state['user'], selected_crop, element,
+                                     dates_key, highlight_site)
             
             # Key must remain static to preserve selection state across reruns
             event = st.plotly_chart(fig, use_container_width=True, config=config, on_select="rerun", selection_mode="points", key=chart_key)
@@ -935,17 +1022,17 @@ def main():
         with d_col1:
             with st.container(border=True):
                 st.markdown(f"<h3 style='text-align: center; margin-bottom: 0;'>{t['distribution']} N</h3>", unsafe_allow_html=True)
-                event_n = plot_jitter_modern('N', OPTIMAL_RANGES['N'], 'chart_n', current_highlight)
+                event_n = plot_jitter_modern('N', 'chart_n', current_highlight)
             
         with d_col2:
             with st.container(border=True):
                 st.markdown(f"<h3 style='text-align: center; margin-bottom: 0;'>{t['distribution']} P</h3>", unsafe_allow_html=True)
-                event_p = plot_jitter_modern('P', OPTIMAL_RANGES['P'], 'chart_p', current_highlight)
+                event_p = plot_jitter_modern('P', 'chart_p', current_highlight)
 
         with d_col3:
             with st.container(border=True):
                 st.markdown(f"<h3 style='text-align: center; margin-bottom: 0;'>{t['distribution']} K</h3>", unsafe_allow_html=True)
-                event_k = plot_jitter_modern('K', OPTIMAL_RANGES['K'], 'chart_k', current_highlight)
+                event_k = plot_jitter_modern('K', 'chart_k', current_highlight)
         
         # Process Clicks
         # Check which event has selection
@@ -955,13 +1042,20 @@ def main():
         def extract_selection(event):
             if event and event.selection and event.selection.points:
                 pt = event.selection.points[0]
-                # customdata should be [Site, Sample]
+                # customdata is the site code (index into the slice's site list)
                 if 'customdata' in pt:
                     data = pt['customdata']
                     # Check if it's a list/array and get first element
                     if isinstance(data, (list, tuple, np.ndarray)) and len(data) > 0:
-                        return data[0], pt['x']
-                    return data, pt['x'] # Fallback if just string
+                        data = data[0]
+                    try:
+                        code = int(data)
+                    except (TypeError, ValueError):
+                        return None, None
+                    # -1 is a missing site (pd.factorize), not the last one
+                    if 0 <= code < len(slice_index['sites']):
+                        return slice_index['sites'][code], pt['x']
+                    return None, None
             return None, None
 
         s_n, d_n = extract_selection(event_n)
@@ -1008,66 +1102,65 @@ def main():
              
         # Trend Plotting Logic
         # Return to clean 'Daily Mean' aesthetic
-        
-        def plot_trend_modern(element, color, limits):
-                min_lim, max_lim = limits
-                
-                fig = go.Figure()
-
-                # Determine Data Source
-                if st.session_state['clicked_site']:
-                    # Specific Site
-                    hl_site = st.session_state['clicked_site']
-                    # Daily Mean for Site
-                    plot_df = crop_data[crop_data['site'] == hl_site].groupby('date')[['N', 'P', 'K']].mean().reset_index().sort_values('date')
-                    plot_name = hl_site
-                    style_dict = dict(color=color, width=3, shape='spline')
-                else:
-                    # Global Average
-                    plot_df = crop_data.groupby('date')[['N', 'P', 'K']].mean().reset_index().sort_values('date')
-                    plot_name = "Global Avg"
-                    style_dict = dict(color=color, width=3, shape='spline') # Treat global same as site style-wise for consistent look
-
-                fig.add_trace(go.Scatter(
-                    x=plot_df['date'], y=plot_df[element],
-                    mode='lines+markers',
-                    line=style_dict,
-                    marker=dict(size=8, color='white', line=dict(width=2, color=color)),
-                    name=plot_name,
-                    hovertemplate='%{x|%d/%m/%y}: %{y:.2f}'
-                ))
-
-                # Limits
-                fig.add_hline(y=min_lim, line_width=1, line_dash="dash", line_color="#10B981")
-                fig.add_hline(y=max_lim, line_width=1, line_dash="dash", line_color="#10B981")
-                
-                # Reference Line for Clicked Date
-                if st.session_state['clicked_date']:
-                    fig.add_vline(x=st.session_state['clicked_date'], line_width=2, line_dash="dot", line_color="#EF4444")
-
-                fig.update_layout(
-                    margin=dict(l=40, r=40, t=10, b=40),
-                    height=280, 
-                    plot_bgcolor='white',
-                    paper_bgcolor='white',
-                    xaxis=dict(showgrid=True, gridcolor='#F3F4F6', tickformat='%d/%m/%y'),
-                    yaxis=dict(showgrid=True, gridcolor='#F3F4F6'),
-                    showlegend=True
-                )
-                return fig
+        # Figure specs are cached; each one shares the memoized daily-means aggregate
+        def plot_trend_modern(element):
+                return load_trend_figure(sample_set, data_fp, st.session_state['user'], selected_crop, element,
+                                         st.session_state['clicked_site'], st.session_state['clicked_date'])
 
         t_col1, t_col2, t_col3 = st.columns(3)
         with t_col1:
-                st.plotly_chart(plot_trend_modern('N', '#3B82F6', OPTIMAL_RANGES['N']), use_container_width=True, config=config) # Blue
+                st.plotly_chart(plot_trend_modern('N'), use_container_width=True, config=config) # Blue
         with t_col2:
-                st.plotly_chart(plot_trend_modern('P', '#F59E0B', OPTIMAL_RANGES['P']), use_container_width=True, config=config) # Amber
+                st.plotly_chart(plot_trend_modern('P'), use_container_width=True, config=config) # Amber
         with t_col3:
-                st.plotly_chart(plot_trend_modern('K', '#10B981', OPTIMAL_RANGES['K']), use_container_width=True, config=config) # Green
+                st.plotly_chart(plot_trend_modern('K'), use_container_width=True, config=config) # Green
 
             
-    # Raw Data Expander
-    with st.expander("Show Raw Data Table / הצג נתונים גולמיים"):
-        st.dataframe(filtered_df, use_container_width=True)
+    # Raw Data Table
+    # A toggle rather than an expander: a collapsed expander still ships its
+    # dataframe to the browser, the toggle sends nothing until it is switched on
+    if st.toggle("Show Raw Data Table / הצג נתונים גולמיים", key="show_raw_table"):
+        with st.container(border=True):
+            table_columns = [c for c in sample_set.samples.columns if c not in TABLE_HIDDEN_COLUMNS]
+            tb_col1, tb_col2, tb_col3, tb_col4 = st.columns([3, 2, 3, 2])
+            with tb_col1:
+                sort_by = st.selectbox("Sort by", table_columns,
+                                       index=table_columns.index('date') if 'date' in table_columns else 0, key="table_sort")
+            with tb_col2:
+                sort_dir = st.radio("Order", ["↑", "↓"], horizontal=True, key="table_sort_dir")
+            with tb_col3:
+                table_query = st.text_input("Filter (site / sample)", key="table_query")
+            with tb_col4:
+                page_size = st.selectbox("Rows per page", TABLE_PAGE_SIZES, key="table_page_size")
+
+            table_args = (sample_set, data_fp, st.session_state['user'], selected_crop, dates_key,
+                          sort_by, sort_dir == "↑", table_query.strip() or None)
+            total_rows = len(load_table_order(*table_args))
+            n_pages = max(1, -(-total_rows // page_size))
+            # Keep the page valid when a filter shrinks the result
+            if st.session_state.get('table_page', 1) > n_pages:
+                st.session_state['table_page'] = n_pages
+            page = st.number_input("Page", min_value=1, max_value=n_pages, step=1, key="table_page")
+
+            st.dataframe(load_table_page(*table_args, page=int(page), page_size=page_size),
+                         use_container_width=True, hide_index=True)
+            first_row = (int(page) - 1) * page_size + 1 if total_rows else 0
+            st.caption(f"Rows {first_row}-{min(int(page) * page_size, total_rows)} of {total_rows} • page {int(page)}/{n_pages}")
+
+    # Export (files are written in chunks on first use and reused for the same selection)
+    if st.toggle("Export Data / ייצוא נתונים", key="show_export"):
+        with st.container(border=True):
+            export_format = st.radio("Format", export.available_formats(), horizontal=True, key="export_format")
+            samples_path, trends_path = prepare_export(sample_set, data_fp, data_version, st.session_state['user'], selected_crop,
+                                                       dates_key, export_format)
+            mime = 'text/csv' if export_format == 'csv' else 'application/octet-stream'
+            ex_col1, ex_col2 = st.columns(2)
+            # download_button reads the file into memory and serves it from there:
+            # the export is built in chunks, but not streamed to the browser
+            for col, path, label in ((ex_col1, samples_path, "⬇️ Samples"), (ex_col2, trends_path, "⬇️ Daily averages")):
+                with col, open(path, 'rb') as fh:
+                    st.download_button(label, fh, file_name=f"{selected_crop}_{os.path.basename(path).rsplit('_', 1)[-1]}",
+                                       mime=mime, use_container_width=True)
 
 import traceback
 
@@ -1,4 +1,6 @@
 import os
+import datetime
+import threading
 import streamlit as st
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -9,9 +11,111 @@ SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 TOKEN_FILE = 'token.json'
 CREDENTIALS_FILE = 'credentials.json'
 
-@st.cache_resource
+# Refresh this long before the access token expires
+REFRESH_MARGIN_SECONDS = 5 * 60
+# Never re-schedule faster than this (also the retry delay after a failed refresh)
+MIN_REFRESH_INTERVAL = 30
+
+
+def _write_token_file(path, creds):
+    """Writes token.json atomically (temp file + rename)."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, path)
+
+
+class CredentialManager:
+    """
+    Keeps one Credentials object valid for the life of the process.
+    A daemon timer refreshes the token shortly before expiry, so Drive calls never
+    pay for a refresh themselves; refreshes are serialized with a lock.
+    """
+
+    def __init__(self, creds, token_file=None):
+        self.creds = creds
+        self.token_file = token_file
+        self._lock = threading.Lock()
+        self._timer = None
+        self._schedule()
+
+    def _seconds_to_expiry(self):
+        if not self.creds.expiry:
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+        return (self.creds.expiry - now).total_seconds()
+
+    def needs_refresh(self):
+        if not self.creds.refresh_token:
+            return False
+        left = self._seconds_to_expiry()
+        if left is None:
+            return not self.creds.valid
+        return left < REFRESH_MARGIN_SECONDS
+
+    def refresh(self, force=False):
+        """Refreshes the token if it is close to expiry (or force). Thread-safe."""
+        with self._lock:
+            # Another thread (or google-auth inline) may have refreshed already: nothing
+            # to do now, but the timer must still be re-armed for the new expiry
+            refreshed = force or self.needs_refresh()
+            if refreshed:
+                self.creds.refresh(Request())
+            # Save the refreshed creds locally if possible (not possible in cloud usually, but harmless to try)
+            if refreshed and self.token_file and os.path.exists(self.token_file):
+                try:
+                    _write_token_file(self.token_file, self.creds)
+                except OSError as e:
+                    print(f"Could not save refreshed token: {e}")
+        self._schedule()
+
+    def _schedule(self, delay=None):
+        if not self.creds.refresh_token:
+            return
+        if delay is None:
+            left = self._seconds_to_expiry()
+            if left is None:
+                return
+            delay = left - REFRESH_MARGIN_SECONDS
+        delay = max(MIN_REFRESH_INTERVAL, delay)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # No st.* calls here: this runs outside any Streamlit session
+            print(f"Background token refresh failed, retrying in {MIN_REFRESH_INTERVAL}s: {e}")
+            self._schedule(MIN_REFRESH_INTERVAL)
+
+    def get(self):
+        """Returns the credentials; refreshes inline only if the background refresh fell behind."""
+        left = self._seconds_to_expiry()
+        if self.creds.refresh_token and (not self.creds.valid or (left is not None and left <= 0)):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing creds: {e}")
+        return self.creds
+
+
 def get_creds():
     """Gets valid user credentials from local storage or st.secrets."""
+    manager = get_credential_manager()
+    if manager is None:
+        # Don't cache "no credentials": setup_auth may create token.json later in this process
+        get_credential_manager.clear()
+        return None
+    return manager.get()
+
+
+@st.cache_resource
+def get_credential_manager():
+    """Loads credentials once per process and wraps them in a CredentialManager."""
     creds = None
     
     # 1. Check st.secrets (for Cloud Deployment)
@@ -43,20 +147,24 @@ def get_creds():
         except Exception as e:
             print(f"Error loading token.json: {e}")
 
-    # 3. Refresh if expired
-    if creds and creds.expired and creds.refresh_token:
+    if not creds:
+        return None
+    manager = CredentialManager(creds, token_file=TOKEN_FILE)
+
+    # 3. Refresh now if the token is unusable, about to expire, or has no known expiry
+    # (e.g. built from secrets without one): the refresh sets an expiry, which arms the
+    # background timer. Later refreshes happen in the background.
+    if creds.refresh_token and (not creds.valid or not creds.expiry or manager.needs_refresh()):
         try:
-            creds.refresh(Request())
-            # Save the refreshed creds locally if possible (not possible in cloud usually, but harmless to try)
-            if os.path.exists(TOKEN_FILE):
-                with open(TOKEN_FILE, 'w') as token:
-                    token.write(creds.to_json())
+            manager.refresh(force=True)
         except Exception as e:
             st.warning(f"Error refreshing creds: {e}")
+            # Keep retrying in the background rather than leaving it to the request path
+            manager._schedule(MIN_REFRESH_INTERVAL)
             # If refresh fails, we might still try to return creds or set to None?
             # Usually if refresh fails, the token is useless.
             # But let's return it and let the API call fail if it must, or maybe set to None.
             # For now, let's keep it, but warn.
             pass
     
-    return creds
+    return manager
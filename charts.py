@@ -0,0 +1,274 @@
+import base64
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import ranges
+
+# Trend line colour per element
+TREND_COLORS = {
+    'N': '#3B82F6',  # Blue
+    'P': '#F59E0B',  # Amber
+    'K': '#10B981',  # Green
+}
+
+# Hover for points that carry "site · sample" text; larger groups show date and value only
+HOVER_TEMPLATE = '%{text}<br><b>Date:</b> %{x|%d/%m/%y}<br><b>Val:</b> %{y:.2f}<extra></extra>'
+HOVER_TEMPLATE_NO_TEXT = '<b>Date:</b> %{x|%d/%m/%y}<br><b>Val:</b> %{y:.2f}<extra></extra>'
+
+# Traces with at most this many points carry per-point hover text (site and sample);
+# bigger ones only send typed arrays (the site is resolved server-side on click)
+HOVER_TEXT_MAX_POINTS = 2000
+
+# Traces with more points than this are drawn with WebGL (Scattergl) instead of SVG
+WEBGL_THRESHOLD = 1500
+# Above this many points, samples are binned per date into density markers
+DENSITY_THRESHOLD = 20000
+# Value bins per date in density mode
+DENSITY_BINS = 40
+# Largest density marker, relative to the normal marker size
+DENSITY_MAX_SCALE = 2.0
+
+
+def _density_points(subset_df, element, bins=DENSITY_BINS):
+    """
+    Bins samples by (date, range status, value range). One row per non-empty bin
+    with the mean value, the sample count, the status and the bin's most common
+    site, so hover and click-to-site still work on the binned markers. Samples
+    with different statuses never share a bin, so out-of-range ones stay visible.
+    """
+    status_col = f'{element}_status'
+    vals = subset_df[element]
+    lo, hi = vals.min(), vals.max()
+    width = (hi - lo) / bins if hi > lo else 1.0
+    binned = subset_df[['date', 'site_code', element, status_col]].assign(_bin=((vals - lo) // width).clip(0, bins - 1).astype(int))
+    keys = ['date', status_col, '_bin']
+
+    points = binned.groupby(keys)[element].agg(['mean', 'size']).reset_index()
+    site_counts = binned.groupby(keys + ['site_code']).size().reset_index(name='n')
+    top_sites = site_counts.sort_values('n', ascending=False).drop_duplicates(keys)
+    points = points.merge(top_sites[keys + ['site_code']], on=keys, how='left')
+
+    points = points.rename(columns={'mean': element, 'size': 'count'})
+    points['sample'] = points['count'].astype(str) + ' samples'
+    points['scale'] = 1.0 + (DENSITY_MAX_SCALE - 1.0) * np.sqrt(points['count'] / points['count'].max())
+    return points
+
+
+def epoch_ms(dates):
+    """Dates as float milliseconds since the epoch (what a 'date' axis plots), NaT as NaN."""
+    values = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ms]')
+    ms = values.astype(np.int64).astype(np.float64)
+    ms[np.isnat(values)] = np.nan
+    return ms
+
+
+def _add_jitter_traces(fig, subset_df, element, limits, site_names, is_highlighted, is_background):
+    if subset_df.empty: return
+    min_lim, max_lim = limits
+
+    # Adaptive rendering: SVG for small traces, WebGL for large ones, density bins beyond that
+    n_points = len(subset_df)
+    scale = None
+    if n_points > DENSITY_THRESHOLD:
+        subset_df = _density_points(subset_df, element)
+        scale = subset_df['scale'].to_numpy()
+    trace_type = go.Scattergl if n_points > WEBGL_THRESHOLD else go.Scatter
+
+    vals = subset_df[element]
+    # Per-row status from ranges.status_matrix (rows may have crop/stage-specific ranges)
+    status_col = f'{element}_status'
+    if status_col in subset_df.columns:
+        is_in = (subset_df[status_col] == ranges.OK).to_numpy()
+    else:
+        is_in = vals.between(min_lim, max_lim).to_numpy()
+
+    # Styles
+    if is_background:
+        opacity = 0.1
+        size = 8
+        color_in = '#9CA3AF' # Gray
+        color_out = '#9CA3AF'
+        line_width = 0
+    elif is_highlighted:
+        opacity = 1.0
+        size = 14
+        color_in = '#10B981' # Green
+        color_out = '#EF4444' # Red
+        line_width = 2 # Bold border
+    else: # Default (No selection)
+        opacity = 0.7
+        size = 10
+        color_in = '#10B981'
+        color_out = '#EF4444'
+        line_width = 1
+
+    # One trace per range status; numeric columns go out as typed arrays and
+    # customdata is the int32 site code (mapped back to a name on click)
+    x = epoch_ms(subset_df['date'])
+    y = vals.to_numpy(dtype=np.float64)
+    site_codes = subset_df['site_code'].to_numpy(dtype=np.int32)
+    sizes = None if scale is None else np.round(scale * size, 1)
+    marker_line = dict(width=line_width, color='white' if not is_background else 'transparent')
+
+    for rows, color, name in ((is_in, color_in, 'in'), (~is_in, color_out, 'out')):
+        n_rows = int(rows.sum())
+        if not n_rows:
+            continue
+        text = None
+        if not is_background and n_rows <= HOVER_TEXT_MAX_POINTS:
+            names = np.asarray([str(site) for site in site_names] + [''], dtype=object)
+            text = names[site_codes[rows]] + ' · ' + subset_df['sample'].astype(str).to_numpy(dtype=object)[rows]
+        if is_background:
+            hovertemplate = None
+        else:
+            hovertemplate = HOVER_TEMPLATE if text is not None else HOVER_TEMPLATE_NO_TEXT
+        fig.add_trace(trace_type(
+            x=x[rows], y=y[rows],
+            mode='markers',
+            marker=dict(color=color, size=size if sizes is None else sizes[rows], opacity=opacity, line=marker_line),
+            name=name,
+            customdata=site_codes[rows],
+            text=text,
+            hovertemplate=hovertemplate,
+            showlegend=False
+        ))
+
+
+def jitter_figure(df, element, limits, site_names, highlight_site=None, highlight_rows=None):
+    """
+    Distribution of one element per sample date, green inside / red outside the
+    optimal range. With highlight_site, the other sites are drawn faded behind it;
+    highlight_rows (boolean mask over df) saves comparing every site name.
+    df needs a 'site_code' column indexing site_names (see metrics.build_slice_index;
+    code -1, a missing site, shows as a blank name).
+    """
+    min_lim, max_lim = limits
+    fig = go.Figure()
+
+    if highlight_site:
+        if highlight_rows is None:
+            highlight_rows = (df['site'] == highlight_site).to_numpy()
+        # 1. Plot Background (All other sites)
+        bg_df = df[~highlight_rows]
+        _add_jitter_traces(fig, bg_df, element, limits, site_names, is_highlighted=False, is_background=True)
+
+        # 2. Plot Highlight (Selected site)
+        hl_df = df[highlight_rows]
+        _add_jitter_traces(fig, hl_df, element, limits, site_names, is_highlighted=True, is_background=False)
+    else:
+        # Plot All Normal
+        _add_jitter_traces(fig, df, element, limits, site_names, is_highlighted=False, is_background=False)
+
+    # Limit Lines
+    fig.add_hline(y=min_lim, line_width=1, line_dash="dash", line_color="#10B981", opacity=0.6)
+    fig.add_hline(y=max_lim, line_width=1, line_dash="dash", line_color="#10B981", opacity=0.6)
+
+    fig.update_layout(
+        showlegend=False, # cleaner look
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        margin=dict(l=40, r=40, t=40, b=40),
+        height=320,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(type='date', showgrid=True, gridcolor='#F3F4F6', automargin=True, tickformat='%d/%m/%y', tickangle=0),
+        yaxis=dict(showgrid=True, gridcolor='#F3F4F6', automargin=True),
+        dragmode='select',
+        clickmode='event+select'
+    )
+    return fig
+
+
+def trend_figure(plot_df, element, limits, plot_name, clicked_date=None):
+    """Daily mean line for one element, with the optimal range and an optional marker for the clicked date."""
+    min_lim, max_lim = limits
+    color = TREND_COLORS[element]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=epoch_ms(plot_df['date']), y=plot_df[element].to_numpy(dtype=np.float64),
+        mode='lines+markers',
+        line=dict(color=color, width=3, shape='spline'),
+        marker=dict(size=8, color='white', line=dict(width=2, color=color)),
+        name=plot_name,
+        hovertemplate='%{x|%d/%m/%y}: %{y:.2f}'
+    ))
+
+    # Limits
+    fig.add_hline(y=min_lim, line_width=1, line_dash="dash", line_color="#10B981")
+    fig.add_hline(y=max_lim, line_width=1, line_dash="dash", line_color="#10B981")
+
+    # Reference Line for Clicked Date
+    if clicked_date:
+        fig.add_vline(x=clicked_date, line_width=2, line_dash="dot", line_color="#EF4444")
+
+    fig.update_layout(
+        margin=dict(l=40, r=40, t=10, b=40),
+        height=280,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(type='date', showgrid=True, gridcolor='#F3F4F6', tickformat='%d/%m/%y'),
+        yaxis=dict(showgrid=True, gridcolor='#F3F4F6'),
+        showlegend=True
+    )
+    return fig
+
+
+def typed_array(values):
+    """
+    Plotly typed-array spec ({dtype, bdata}: base64 of the raw little-endian
+    buffer) for numeric data, instead of a JSON list of numbers.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'b':
+        arr = arr.astype(np.uint8)
+    elif arr.dtype.kind in 'iu' and arr.dtype.itemsize == 8:
+        # plotly.js has no 64-bit integer arrays
+        fits = arr.size == 0 or (arr.min() >= np.iinfo(np.int32).min and arr.max() <= np.iinfo(np.int32).max)
+        arr = arr.astype(np.int32) if fits else arr.astype(np.float64)
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('<'))
+    spec = {'dtype': arr.dtype.str[1:], 'bdata': base64.b64encode(arr.tobytes()).decode('ascii')}
+    if arr.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in arr.shape)
+    return spec
+
+
+def _compact(values):
+    if isinstance(values, (list, tuple, np.ndarray)):
+        arr = np.asarray(values)
+        if arr.size and arr.dtype.kind in 'biuf':
+            return typed_array(arr)
+    return values
+
+
+def _array_bytes(values):
+    if isinstance(values, dict):
+        return len(values.get('bdata', ''))
+    if isinstance(values, (list, tuple, np.ndarray)):
+        return sum(len(str(v)) for v in values)
+    return 0
+
+
+def to_spec(fig, label=None):
+    """
+    Figure dict for st.plotly_chart with numeric arrays as typed arrays
+    (plotly.py 6 may already have encoded them; those are left as they are).
+    With a label, logs the size of the per-point data (encoded arrays and text),
+    which is most of the payload, without serializing the figure again.
+    """
+    spec = fig.to_dict()
+    array_bytes = 0
+    for trace in spec.get('data', []):
+        for key in ('x', 'y', 'customdata'):
+            if key in trace:
+                trace[key] = _compact(trace[key])
+                array_bytes += _array_bytes(trace[key])
+        array_bytes += _array_bytes(trace.get('text'))
+        marker = trace.get('marker')
+        if marker:
+            for key in ('color', 'size'):
+                if key in marker:
+                    marker[key] = _compact(marker[key])
+                    array_bytes += _array_bytes(marker[key])
+    if label:
+        print(f"Chart payload {label}: {array_bytes / 1024:.1f} KB of point data ({len(spec.get('data', []))} traces)")
+    return spec
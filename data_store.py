@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+VERSIONS_DIR = os.path.join(DATA_DIR, 'versions')
+CURRENT_FILE = os.path.join(DATA_DIR, 'CURRENT')
+MANIFEST_NAME = 'manifest.json'
+
+# Published versions kept on disk (older ones may still be open by a slow reader)
+KEEP_VERSIONS = 3
+# Staging dirs left behind by a crashed sync are removed after this long
+STALE_STAGING_SECONDS = 60 * 60
+
+
+def current_version():
+    """Returns the published version id, or None (legacy flat data/ layout)."""
+    try:
+        with open(CURRENT_FILE, 'r') as f:
+            version_id = f.read().strip()
+    except (FileNotFoundError, OSError):
+        return None
+    if version_id and os.path.isdir(os.path.join(VERSIONS_DIR, version_id)):
+        return version_id
+    return None
+
+
+def version_dir(version_id):
+    return os.path.join(VERSIONS_DIR, version_id)
+
+
+def current_dir():
+    """Directory holding the current consistent snapshot of the data files."""
+    version_id = current_version()
+    if version_id:
+        return version_dir(version_id)
+    return DATA_DIR
+
+
+def snapshot_dir(version_id=None):
+    """Directory of a given version (None: the legacy flat data/ layout)."""
+    return version_dir(version_id) if version_id else DATA_DIR
+
+
+def begin_version():
+    """Creates an empty staging directory. Returns (version_id, staging_dir)."""
+    version_id = time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+    staging_dir = os.path.join(VERSIONS_DIR, f".staging-{version_id}")
+    os.makedirs(staging_dir)
+    return version_id, staging_dir
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def carry_forward(staging_dir, name, source_dir=None):
+    """
+    Puts the current snapshot's copy of `name` into the staging dir
+    (hardlink when possible). Returns False if there is no previous copy.
+    """
+    src = os.path.join(source_dir or current_dir(), name)
+    dest = os.path.join(staging_dir, name)
+    if not os.path.exists(src):
+        return False
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+    return True
+
+
+def publish(version_id, staging_dir, file_meta=None, complete=True):
+    """
+    Writes the manifest, moves the staging dir into place and atomically points
+    CURRENT at it. file_meta ({name: {...}}) is stored alongside each file's hash.
+    complete=False marks a snapshot made by a partial (lazy) fetch.
+    """
+    file_meta = file_meta or {}
+    manifest = {'version': version_id, 'published_at': time.time(), 'complete': bool(complete), 'files': {}}
+    for name in sorted(os.listdir(staging_dir)):
+        path = os.path.join(staging_dir, name)
+        if name == MANIFEST_NAME or name.endswith(('.part', '.tmp')) or not os.path.isfile(path):
+            continue
+        entry = {'bytes': os.path.getsize(path), 'sha256': _sha256(path)}
+        entry.update(file_meta.get(name, {}))
+        manifest['files'][name] = entry
+    with open(os.path.join(staging_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+    final_dir = version_dir(version_id)
+    os.rename(staging_dir, final_dir)
+
+    # The pointer swap is the commit point: readers see either the old or the new snapshot
+    tmp_path = CURRENT_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version_id)
+    os.replace(tmp_path, CURRENT_FILE)
+    print(f"Published data version {version_id} ({len(manifest['files'])} files).")
+
+    collect_garbage()
+    return version_id
+
+
+def discard(staging_dir):
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def read_manifest(version_id=None):
+    """Returns the manifest of a version (default: current), or None."""
+    version_id = version_id or current_version()
+    if not version_id:
+        return None
+    try:
+        with open(os.path.join(version_dir(version_id), MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def is_complete(version_id=None):
+    """True if the snapshot came from a full sync (legacy flat data/ counts as complete)."""
+    version_id = version_id or current_version()
+    if not version_id:
+        return os.path.exists(os.path.join(DATA_DIR, 'users.csv'))
+    manifest = read_manifest(version_id)
+    return bool(manifest and manifest.get('complete', True))
+
+
+def collect_garbage(keep=KEEP_VERSIONS):
+    """Removes old published versions and abandoned staging dirs."""
+    if not os.path.isdir(VERSIONS_DIR):
+        return
+    current = current_version()
+    published = []
+    for name in os.listdir(VERSIONS_DIR):
+        path = os.path.join(VERSIONS_DIR, name)
+        if name.startswith('.staging-'):
+            if time.time() - os.path.getmtime(path) > STALE_STAGING_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+        elif os.path.isdir(path):
+            published.append(name)
+
+    # Version ids start with a timestamp, so name order is age order
+    for name in sorted(published)[:-keep] if keep else sorted(published):
+        if name != current:
+            shutil.rmtree(os.path.join(VERSIONS_DIR, name), ignore_errors=True)
@@ -0,0 +1,148 @@
+import os
+import time
+import struct
+import threading
+import ctypes
+import ctypes.util
+import data_store
+
+# inotify constants (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+# Polling fallback interval (no inotify: macOS, Windows, some containers)
+POLL_SECONDS = 5
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1  # Linux only
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def _relevant(name):
+    # Temp files are followed by a rename, which is the event that matters
+    return bool(name) and not name.endswith(('.tmp', '.part'))
+
+
+class DataWatcher:
+    """
+    Watches data/ (the CURRENT pointer, and the CSVs of the legacy flat layout)
+    and bumps `generation` when something there changes. Readers key their
+    caches on the generation, so data stays cached until it actually changes.
+    """
+
+    def __init__(self, path=data_store.DATA_DIR, poll_seconds=POLL_SECONDS):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.generation = 0
+        self.mode = None
+        self._lock = threading.Lock()
+        self._changed_at = {}
+        if not os.path.exists(path):
+            os.makedirs(path)
+        thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+        thread.start()
+
+    def _bump(self, changed_at, reason):
+        with self._lock:
+            self.generation += 1
+            self._changed_at[self.generation] = changed_at
+            generation = self.generation
+        print(f"Data change detected ({reason}), generation {generation}.")
+
+    def refreshed(self, generation):
+        """
+        Call once the caches for `generation` are rebuilt; logs the latency from the
+        oldest change it covers and forgets the change times of older generations.
+        """
+        with self._lock:
+            # This load covers every change up to `generation`, including skipped ones
+            covered = [g for g in self._changed_at if g <= generation]
+            changed_at = min((self._changed_at.pop(g) for g in covered), default=None)
+        if changed_at is None:
+            return None
+        latency = time.time() - changed_at
+        print(f"Data refresh: generation {generation} loaded {latency * 1000:.0f} ms after the change ({self.mode}).")
+        return latency
+
+    def _run(self):
+        libc = _load_libc()
+        if libc is not None:
+            try:
+                self._run_inotify(libc)
+                return
+            except OSError as e:
+                print(f"inotify unavailable ({e}), polling {self.path} every {self.poll_seconds}s.")
+                if self.mode == 'inotify':
+                    # Changes may have been missed while the watch was failing
+                    self._bump(time.time(), 'watch lost')
+        self._run_polling()
+
+    def _run_inotify(self, libc):
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            if libc.inotify_add_watch(fd, self.path.encode(), WATCH_MASK) < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            self.mode = 'inotify'
+            while True:
+                buf = os.read(fd, 64 * 1024)
+                received_at = time.time()
+                names = []
+                offset = 0
+                while offset + EVENT_HEADER.size <= len(buf):
+                    _, mask, _, name_len = EVENT_HEADER.unpack_from(buf, offset)
+                    offset += EVENT_HEADER.size
+                    name = buf[offset:offset + name_len].rstrip(b'\0').decode('utf-8', 'replace')
+                    offset += name_len
+                    if mask & (IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                        # Lost events or lost the directory: fall back to polling
+                        raise OSError(0, "watch lost")
+                    if _relevant(name):
+                        names.append(name)
+                if names:
+                    self._bump(received_at, ', '.join(sorted(set(names))[:3]))
+        finally:
+            os.close(fd)
+
+    def _signature(self):
+        """(name, mtime_ns, size) of data/'s entries, plus the newest mtime."""
+        entries = []
+        newest = 0
+        try:
+            for entry in os.scandir(self.path):
+                if not _relevant(entry.name) or entry.is_dir():
+                    continue
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+                newest = max(newest, stat.st_mtime)
+        except FileNotFoundError:
+            pass
+        return tuple(sorted(entries)), newest
+
+    def _run_polling(self):
+        self.mode = 'polling'
+        last, _ = self._signature()
+        while True:
+            time.sleep(self.poll_seconds)
+            current, newest = self._signature()
+            if current != last:
+                last = current
+                # Latency is measured from the file's mtime, so it includes the polling delay
+                self._bump(newest or time.time(), 'poll')
@@ -0,0 +1,156 @@
+import os
+import glob
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import ranges
+
+# Files in a snapshot that are not sample data
+NON_SAMPLE_FILES = ('users.csv', ranges.RANGES_FILE)
+
+# Parsed sample files by content key, so a new snapshot only parses the files that changed
+_parse_lock = threading.Lock()
+_parsed = {}
+
+
+def read_sample_file(path):
+    """Reads one sample CSV with normalized column names and parsed dates."""
+    df = pd.read_csv(path)
+    # Normalize columns
+    df.columns = df.columns.str.strip()
+    if 'user' in df.columns:
+        df.rename(columns={'user': 'username'}, inplace=True)
+
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], dayfirst=True, errors='coerce')
+    return df
+
+
+def file_key(path, manifest=None):
+    """Content key of a snapshot file: its manifest sha256, else path + mtime + size (flat data/ layout)."""
+    entry = ((manifest or {}).get('files') or {}).get(os.path.basename(path)) or {}
+    if entry.get('sha256'):
+        return entry['sha256']
+    stat = os.stat(path)
+    return f"{path}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def _parse_cached(path, key):
+    """(frame, set of usernames) of a sample file, parsed once per content key. Don't modify the frame."""
+    with _parse_lock:
+        cached = _parsed.get(key)
+    if cached is not None:
+        return cached
+    df = read_sample_file(path)
+    users = {str(u).strip() for u in df['username'].dropna().unique()} if 'username' in df.columns else set()
+    with _parse_lock:
+        _parsed[key] = (df, users)
+    return df, users
+
+
+def _read(data_dir, manifest=None):
+    """Returns (samples, {file name: (content key, usernames)}, ranges table, ranges key)."""
+    data_frames = []
+    files = {}
+
+    # Sorted, so a grower's rows keep the same order across snapshots
+    for f in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        if os.path.basename(f) in NON_SAMPLE_FILES: continue
+        try:
+            key = file_key(f, manifest)
+            df, users = _parse_cached(f, key)
+            data_frames.append(df)
+            files[os.path.basename(f)] = (key, users)
+        except Exception as e:
+            print(f"Error reading {f}: {e}")
+
+    # Old snapshots' files are forgotten lazily, when a newer snapshot is read
+    live_keys = {key for key, _ in files.values()}
+    with _parse_lock:
+        for key in [k for k in _parsed if k not in live_keys]:
+            del _parsed[key]
+
+    ranges_path = os.path.join(data_dir, ranges.RANGES_FILE)
+    ranges_key = file_key(ranges_path, manifest) if os.path.exists(ranges_path) else ''
+    ranges_table = ranges.load_ranges(data_dir)
+
+    final_df = pd.concat(data_frames, ignore_index=True) if data_frames else pd.DataFrame()
+
+    if not final_df.empty:
+        final_df = final_df.drop_duplicates()
+        if all(c in final_df.columns for c in ranges.ELEMENTS):
+            final_df = final_df.dropna(subset=ranges.ELEMENTS)
+            # Range status for every row, evaluated once per data version
+            status = ranges.status_matrix(final_df, ranges_table)
+            for i, col in enumerate(ranges.STATUS_COLUMNS):
+                final_df[col] = status[:, i]
+
+    return final_df, files, ranges_table, ranges_key
+
+
+def read_samples(data_dir, manifest=None):
+    """
+    All sample rows of a data snapshot: every CSV except users.csv and ranges.csv,
+    de-duplicated, without rows missing N/P/K, plus the per-row range status columns.
+    """
+    return _read(data_dir, manifest)[0]
+
+
+def read_snapshot(data_dir, manifest=None):
+    """Reads a snapshot into a SampleSet (only files not parsed before are read from disk)."""
+    samples, files, ranges_table, ranges_key = _read(data_dir, manifest)
+    return SampleSet(samples, files, ranges_table, ranges_key)
+
+
+class SampleSet:
+    """
+    One snapshot's sample rows, shared by every session and treated as immutable.
+    Derived columns are added once here, and each (user, crop) slice is known by
+    its row positions, so sessions select rows instead of keeping their own copies.
+    """
+
+    def __init__(self, samples, files=None, ranges_table=None, ranges_key=''):
+        self.samples = samples
+        self.ranges_table = ranges_table
+        self._files = files or {}
+        self._ranges_key = ranges_key
+        self._rows = {}
+        if samples.empty:
+            return
+        if 'date' in samples.columns:
+            # Categorical: one label string per unique date instead of one per row
+            date_codes, dates = pd.factorize(samples['date'], sort=True)
+            labels = np.asarray(list(dates.strftime('%d/%m/%y')) + [''], dtype=object)
+            samples['date_fmt'] = pd.Categorical(labels[date_codes])
+        if 'username' in samples.columns and 'crop' in samples.columns:
+            self._rows = samples.groupby(['username', 'crop'], sort=False).indices
+
+    @property
+    def empty(self):
+        return self.samples.empty
+
+    def rows(self, user, crop):
+        """Row positions of a (user, crop) slice."""
+        return self._rows.get((user, crop), np.empty(0, dtype=np.intp))
+
+    def crops(self, user):
+        """Crops with samples for this user, in order of first appearance."""
+        return [crop for (u, crop) in self._rows if u == user]
+
+    def slice(self, user, crop):
+        return self.samples.iloc[self.rows(user, crop)]
+
+    def crop_ranges(self, crop):
+        """Crop-wide optimal (min, max) per element, from ranges.csv or the defaults."""
+        return ranges.ranges_for(self.ranges_table, crop)
+
+    def fingerprint(self, user):
+        """
+        Changes only when something this grower sees changes: the files holding
+        their rows, or ranges.csv. Cache keys built on it survive syncs that only
+        touched other growers' files.
+        """
+        user = str(user).strip()
+        keys = sorted(key for key, users in self._files.values() if user in users)
+        return hashlib.sha1('|'.join(keys + [self._ranges_key]).encode('utf-8')).hexdigest()
@@ -0,0 +1,228 @@
+import time
+import random
+import socket
+import ssl
+import threading
+import contextlib
+import collections
+import email.utils
+from googleapiclient.errors import HttpError
+
+# Retry / backoff settings
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 64.0
+
+# Shared retry budget: at most RETRY_BUDGET retries per RETRY_BUDGET_WINDOW seconds
+# across all threads, so a Drive outage fails fast instead of every call sleeping for minutes.
+RETRY_BUDGET = 30
+RETRY_BUDGET_WINDOW = 60.0
+
+# Token bucket: sustained requests/second and burst size for all Drive calls in this process
+RATE_PER_SECOND = 8.0
+BURST = 16
+
+# Independent metadata calls are grouped into Drive batch requests of this size (Drive max is 100)
+BATCH_SIZE = 50
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'sharingRateLimitExceeded'}
+NETWORK_ERRORS = (socket.timeout, ConnectionError, TimeoutError, ssl.SSLError)
+
+
+class TokenBucket:
+    """Simple thread-safe token bucket."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost=1):
+        """Blocks until `cost` tokens are available (a batch may overdraw the bucket)."""
+        needed = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= cost
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Empties the bucket (used when Drive says we're going too fast)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+
+class RetryBudget:
+    """Sliding-window cap on the number of retries."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.spent = collections.deque()
+        self.lock = threading.Lock()
+
+    def try_spend(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.spent and now - self.spent[0] > self.window:
+                self.spent.popleft()
+            if len(self.spent) >= self.limit:
+                return False
+            self.spent.append(now)
+            return True
+
+
+_bucket = TokenBucket(RATE_PER_SECOND, BURST)
+_budget = RetryBudget(RETRY_BUDGET, RETRY_BUDGET_WINDOW)
+_listeners = threading.local()
+
+
+@contextlib.contextmanager
+def retry_listener(fn):
+    """
+    Within the block, retries on this thread that have no on_retry of their own
+    are reported to fn(error, attempt, delay) (e.g. SyncTelemetry.on_retry).
+    """
+    stack = getattr(_listeners, 'stack', None)
+    if stack is None:
+        stack = _listeners.stack = []
+    stack.append(fn)
+    try:
+        yield fn
+    finally:
+        stack.pop()
+
+
+def _default_on_retry():
+    stack = getattr(_listeners, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def _error_reasons(error):
+    reasons = set()
+    for detail in getattr(error, 'error_details', None) or []:
+        if isinstance(detail, dict) and detail.get('reason'):
+            reasons.add(detail['reason'])
+    if not reasons & RATE_LIMIT_REASONS:
+        # error_details may be missing, a plain string, or lack 'reason' keys: search the raw body too
+        content = getattr(error, 'content', b'') or b''
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='ignore')
+        for reason in RATE_LIMIT_REASONS:
+            if reason in content:
+                reasons.add(reason)
+    return reasons
+
+
+def is_rate_limited(error):
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    return status == 429 or (status == 403 and bool(_error_reasons(error) & RATE_LIMIT_REASONS))
+
+
+def is_retryable(error):
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUS or is_rate_limited(error)
+    return isinstance(error, NETWORK_ERRORS)
+
+
+def retry_after_seconds(error):
+    """Parses a Retry-After header (seconds or HTTP date), capped at MAX_DELAY, or None."""
+    if not isinstance(error, HttpError):
+        return None
+    value = error.resp.get('retry-after')
+    if not value:
+        return None
+    try:
+        return min(MAX_DELAY, max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return min(MAX_DELAY, max(0.0, when.timestamp() - time.time()))
+    except Exception:
+        return None
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+
+def call(fn, *args, on_retry=None, cost=1, **kwargs):
+    """
+    Runs fn(*args, **kwargs) against Drive with rate limiting and retries.
+    on_retry(error, attempt, delay) is called before each retry sleep
+    (default: the innermost retry_listener on this thread).
+    cost is the number of Drive requests fn makes (for batches).
+    """
+    if on_retry is None:
+        on_retry = _default_on_retry()
+    attempt = 0
+    while True:
+        _bucket.acquire(cost)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= MAX_RETRIES:
+                raise
+            if not _budget.try_spend():
+                print(f"Drive retry budget exhausted, giving up: {e}")
+                raise
+            if is_rate_limited(e):
+                _bucket.drain()
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            attempt += 1
+            print(f"Drive call failed ({e}), retry {attempt}/{MAX_RETRIES} in {delay:.1f}s")
+            if on_retry:
+                on_retry(e, attempt, delay)
+            time.sleep(delay)
+
+
+def execute(request, on_retry=None):
+    """Executes a googleapiclient HttpRequest through the retry engine."""
+    return call(request.execute, on_retry=on_retry)
+
+
+def execute_batch(service, requests, batch_size=BATCH_SIZE, on_retry=None):
+    """
+    Executes independent requests as Drive batch calls and returns their
+    responses in the same order. Sub-requests that fail inside a batch are
+    retried individually through execute().
+    """
+    results = [None] * len(requests)
+    failed = set()
+
+    def callback(request_id, response, exception):
+        i = int(request_id)
+        if exception is not None:
+            failed.add(i)
+        else:
+            failed.discard(i)
+            results[i] = response
+
+    for start in range(0, len(requests), batch_size):
+        chunk = range(start, min(start + batch_size, len(requests)))
+        batch = service.new_batch_http_request(callback=callback)
+        for i in chunk:
+            batch.add(requests[i], request_id=str(i))
+        call(batch.execute, on_retry=on_retry, cost=len(chunk))
+
+    for i in sorted(failed):
+        results[i] = execute(requests[i], on_retry=on_retry)
+    return results
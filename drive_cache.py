@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import tempfile
+import drive_api
+
+# Configuration
+DRIVE_FOLDER_NAME = "data app NPK"
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+INVENTORY_FILE = os.path.join(CACHE_DIR, 'drive_inventory.json')
+
+# Rebuild at least once a day even if the change feed says nothing moved
+MAX_AGE_SECONDS = 24 * 60 * 60
+FILE_FIELDS = "id, name, mimeType, modifiedTime, version, size, parents"
+
+
+def load_inventory():
+    """Reads the cached inventory from disk (None if missing or unreadable)."""
+    if not os.path.exists(INVENTORY_FILE):
+        return None
+    try:
+        with open(INVENTORY_FILE, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading Drive inventory cache: {e}")
+        return None
+
+
+def save_inventory(inventory):
+    """Writes the inventory to disk atomically."""
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    # Unique temp name: debug scripts and icon-only syncs may save outside the sync lock
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix='drive_inventory.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(inventory, f)
+        os.replace(tmp_path, INVENTORY_FILE)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _root_folder_request(service, folder_name):
+    return service.files().list(
+        q=f"name = '{folder_name}' and mimeType = '{FOLDER_MIME}' and trashed = false",
+        fields="files(id, name)"
+    )
+
+
+def _children_request(service, folder_id, page_token=None):
+    return service.files().list(
+        q=f"'{folder_id}' in parents and trashed = false",
+        fields=f"nextPageToken, files({FILE_FIELDS})",
+        pageToken=page_token
+    )
+
+
+def find_root_folder(service, folder_name=DRIVE_FOLDER_NAME):
+    """Returns the Drive ID of the root data folder, or None."""
+    results = drive_api.execute(_root_folder_request(service, folder_name))
+    items = results.get('files', [])
+    if not items:
+        return None
+    return items[0]['id']
+
+
+def list_children(service, folder_id):
+    """Lists all non-trashed children of a folder (follows pagination)."""
+    return list_children_many(service, [folder_id])[folder_id]
+
+
+def list_children_many(service, folder_ids, batch_size=drive_api.BATCH_SIZE):
+    """
+    Lists the children of several folders at once using Drive batch requests.
+    Returns {folder_id: [files]}; extra result pages are fetched per folder.
+    """
+    listing = {}
+    responses = drive_api.execute_batch(
+        service, [_children_request(service, fid) for fid in folder_ids], batch_size=batch_size
+    )
+    for folder_id, results in zip(folder_ids, responses):
+        children = list(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        while page_token:
+            results = drive_api.execute(_children_request(service, folder_id, page_token))
+            children.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+        listing[folder_id] = children
+    return listing
+
+
+def _resolve_folders(root_id, files):
+    """Finds 'GrowerNutritionMonitor' and its 'www' folder in a tree listing."""
+    def child_folder(parent_id, name):
+        if not parent_id:
+            return None
+        for f in files:
+            if f['mimeType'] == FOLDER_MIME and f['name'] == name and parent_id in f.get('parents', []):
+                return f['id']
+        return None
+
+    gnm_id = child_folder(root_id, 'GrowerNutritionMonitor')
+    www_id = child_folder(gnm_id, 'www')
+    return {'root': root_id, 'gnm': gnm_id, 'www': www_id}
+
+
+def build_inventory(service, folder_name=DRIVE_FOLDER_NAME, batch_size=drive_api.BATCH_SIZE):
+    """Walks the Drive tree under the root folder and returns a fresh inventory."""
+    # The change token is taken in the same round-trip as the root lookup, BEFORE
+    # listing, so nothing that changes mid-walk is missed.
+    token_resp, root_resp = drive_api.execute_batch(service, [
+        service.changes().getStartPageToken(),
+        _root_folder_request(service, folder_name),
+    ])
+    page_token = token_resp.get('startPageToken')
+
+    roots = root_resp.get('files', [])
+    if not roots:
+        return None
+    root_id = roots[0]['id']
+
+    # Breadth-first: every folder on the same level is listed in one batch
+    files = []
+    level = [root_id]
+    while level:
+        listing = list_children_many(service, level, batch_size=batch_size)
+        next_level = []
+        for folder_id in level:
+            for f in listing[folder_id]:
+                files.append(f)
+                if f['mimeType'] == FOLDER_MIME:
+                    next_level.append(f['id'])
+        level = next_level
+
+    return {
+        'folder_name': folder_name,
+        'folders': _resolve_folders(root_id, files),
+        'files': files,
+        'page_token': page_token,
+        'built_at': time.time(),
+    }
+
+
+def is_fresh(service, inventory):
+    """
+    Cheap validation using the Drive change feed.
+    Returns False if anything inside the cached tree changed since it was built.
+    Advances the stored page token on success so the next check stays small.
+    """
+    if time.time() - inventory.get('built_at', 0) > MAX_AGE_SECONDS:
+        return False
+    page_token = inventory.get('page_token')
+    if not page_token:
+        return False
+
+    known_ids = {f['id'] for f in inventory.get('files', [])}
+    known_ids.add(inventory['folders']['root'])
+
+    while page_token:
+        resp = drive_api.execute(service.changes().list(
+            pageToken=page_token,
+            pageSize=1000,
+            fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(parents))"
+        ))
+        for change in resp.get('changes', []):
+            if change.get('fileId') in known_ids:
+                return False
+            parents = (change.get('file') or {}).get('parents', [])
+            if any(p in known_ids for p in parents):
+                return False
+        if resp.get('newStartPageToken'):
+            inventory['page_token'] = resp['newStartPageToken']
+            break
+        page_token = resp.get('nextPageToken')
+    return True
+
+
+def get_inventory(service, folder_name=DRIVE_FOLDER_NAME, force=False):
+    """Returns the cached Drive inventory, rebuilding it only when stale."""
+    inventory = load_inventory()
+    if inventory and not force and inventory.get('folder_name') == folder_name:
+        try:
+            if is_fresh(service, inventory):
+                save_inventory(inventory)
+                return inventory
+        except Exception as e:
+            print(f"Drive inventory validation failed, rebuilding: {e}")
+
+    print("Building Drive inventory...")
+    inventory = build_inventory(service, folder_name)
+    if inventory:
+        save_inventory(inventory)
+    return inventory
+
+
+def children_of(inventory, folder_id):
+    """Returns the cached direct children of a folder."""
+    if not folder_id:
+        return []
+    return [f for f in inventory.get('files', []) if folder_id in f.get('parents', [])]
+
+
+def iter_files(inventory):
+    """Yields every non-folder entry in the cached tree."""
+    for f in inventory.get('files', []):
+        if f['mimeType'] != FOLDER_MIME:
+            yield f
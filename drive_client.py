@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import threading
+import contextlib
+import collections
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build_from_document
+
+try:
+    from googleapiclient.discovery_cache import get_static_doc
+except ImportError:  # very old google-api-python-client
+    get_static_doc = None
+
+# Configuration
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+DISCOVERY_FILE = os.path.join(CACHE_DIR, 'drive_v3_discovery.json')
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/drive/v3/rest"
+# The cached discovery document is re-fetched after this long (a stale copy is kept if that fails)
+DISCOVERY_TTL_SECONDS = 7 * 24 * 60 * 60
+HTTP_TIMEOUT = 60
+# Idle services kept per credentials (more may be checked out at once; extras are dropped on return)
+POOL_SIZE = 8
+# Credentials with a pool (oldest pool is dropped beyond this)
+MAX_POOLS = 4
+
+_doc_lock = threading.Lock()
+_discovery_doc = None
+_discovery_loaded_at = 0.0
+
+_pool_lock = threading.Lock()
+_pools = collections.OrderedDict()
+
+_stats_lock = threading.Lock()
+_stats = {'builds': 0, 'reused': 0, 'build_seconds': 0.0, 'last_build_seconds': None, 'discovery_source': None}
+
+
+def _fetch_discovery():
+    resp, content = httplib2.Http(timeout=HTTP_TIMEOUT).request(DISCOVERY_URL)
+    if resp.status != 200:
+        raise RuntimeError(f"Could not fetch Drive discovery document (HTTP {resp.status})")
+    return content.decode('utf-8')
+
+
+def _discovery_document():
+    """
+    Drive v3 discovery document: memory -> .cache file -> bundled static doc -> network.
+    Copies older than DISCOVERY_TTL_SECONDS are refreshed from the network.
+    """
+    global _discovery_doc, _discovery_loaded_at
+    with _doc_lock:
+        now = time.time()
+        if _discovery_doc is not None and now - _discovery_loaded_at < DISCOVERY_TTL_SECONDS:
+            return _discovery_doc
+
+        doc, source, stale = None, None, _discovery_doc
+        if os.path.exists(DISCOVERY_FILE):
+            with open(DISCOVERY_FILE, 'r') as f:
+                cached = f.read()
+            if now - os.path.getmtime(DISCOVERY_FILE) < DISCOVERY_TTL_SECONDS:
+                doc, source = cached, 'disk'
+            else:
+                stale = cached or stale
+        if not doc and not stale and get_static_doc:
+            doc, source = get_static_doc('drive', 'v3'), 'static'
+        if not doc:
+            try:
+                doc, source = _fetch_discovery(), 'network'
+            except Exception as e:
+                if not stale:
+                    raise
+                print(f"Could not refresh Drive discovery document ({e}), using the cached one.")
+                doc, source = stale, 'stale'
+
+        if source in ('static', 'network'):
+            try:
+                if not os.path.exists(CACHE_DIR):
+                    os.makedirs(CACHE_DIR)
+                tmp_path = DISCOVERY_FILE + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(doc)
+                os.replace(tmp_path, DISCOVERY_FILE)
+            except OSError as e:
+                print(f"Could not cache Drive discovery document: {e}")
+
+        _discovery_doc = doc
+        # A stale copy is retried after a short while rather than a full TTL
+        _discovery_loaded_at = now if source != 'stale' else now - DISCOVERY_TTL_SECONDS + 300
+        with _stats_lock:
+            _stats['discovery_source'] = source
+        return doc
+
+
+def _pool_for(creds):
+    with _pool_lock:
+        entry = _pools.get(id(creds))
+        if entry is None or entry[0] is not creds:
+            entry = (creds, queue.Queue(maxsize=POOL_SIZE))
+            _pools[id(creds)] = entry
+            while len(_pools) > MAX_POOLS:
+                _pools.popitem(last=False)
+        _pools.move_to_end(id(creds))
+        return entry[1]
+
+
+def _build(creds):
+    t_start = time.perf_counter()
+    http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    service = build_from_document(_discovery_document(), http=http)
+    elapsed = time.perf_counter() - t_start
+    with _stats_lock:
+        _stats['builds'] += 1
+        _stats['build_seconds'] += elapsed
+        _stats['last_build_seconds'] = elapsed
+        source = _stats['discovery_source']
+    print(f"Drive client built in {elapsed * 1000:.0f} ms (discovery: {source}, thread: {threading.current_thread().name})")
+    return service
+
+
+def get_service(creds):
+    """
+    Checks out a Drive v3 service for these credentials from a shared pool, building
+    one only when none is idle. googleapiclient services (and their httplib2
+    connections) are not thread-safe, so a service is used by one thread at a time:
+    hand it back with release() (or use `with client(creds)`) to reuse its connection.
+    """
+    try:
+        service = _pool_for(creds).get_nowait()
+    except queue.Empty:
+        return _build(creds)
+    with _stats_lock:
+        _stats['reused'] += 1
+    return service
+
+
+def _creds_of(service):
+    return getattr(getattr(service, '_http', None), 'credentials', None)
+
+
+def release(service):
+    """Returns a service from get_service to the pool (dropped if the pool is full)."""
+    creds = _creds_of(service)
+    if creds is None:
+        return
+    try:
+        _pool_for(creds).put_nowait(service)
+    except queue.Full:
+        pass
+
+
+@contextlib.contextmanager
+def client(creds):
+    """A pooled service for the duration of the block."""
+    service = get_service(creds)
+    try:
+        yield service
+    finally:
+        release(service)
+
+
+@contextlib.contextmanager
+def client_like(service):
+    """A pooled service with the same credentials as `service`, for another thread."""
+    creds = _creds_of(service)
+    if creds is None:
+        yield service
+        return
+    with client(creds) as own:
+        yield own
+
+
+def stats():
+    """Client construction timings: builds, reuses, total/last build seconds, discovery source."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import time
+import tempfile
+import hashlib
+import shutil
+import data_store
+import dataset
+import metrics
+import ranges
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# Configuration
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'exports')
+# Rows converted per chunk, so an export never holds the whole file in memory
+CHUNK_ROWS = 5000
+# Internal columns left out of exports
+HIDDEN_COLUMNS = ranges.STATUS_COLUMNS + ['date_fmt']
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+# Exports of other data versions are removed once unused for this long (a session may still be serving one)
+MAX_AGE_SECONDS = 24 * 60 * 60
+
+
+def available_formats():
+    return ['csv', 'parquet'] if pq else ['csv']
+
+
+def iter_csv_chunks(df, chunk_rows=CHUNK_ROWS):
+    """Yields df as CSV text, chunk_rows rows at a time (the header comes with the first chunk)."""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+
+
+def _temp_path(path):
+    """Unique temp file next to path, so sessions exporting the same selection don't collide."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    return tmp_path
+
+
+def write_csv(df, path, chunk_rows=CHUNK_ROWS):
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in iter_csv_chunks(df, chunk_rows):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_parquet(df, path, chunk_rows=CHUNK_ROWS):
+    """Writes df as Parquet, one row group per chunk."""
+    if pq is None:
+        raise RuntimeError("pyarrow is not installed, Parquet export is unavailable.")
+    # One schema for every chunk (a chunk with only empty values would infer 'null')
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    tmp_path = _temp_path(path)
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for start in range(0, max(len(df), 1), chunk_rows):
+                chunk = df.iloc[start:start + chunk_rows]
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write(df, path, fmt='csv'):
+    if fmt == 'parquet':
+        write_parquet(df, path)
+    else:
+        write_csv(df, path)
+    return path
+
+
+def export_frames(crop_df, index, dates=None):
+    """
+    The two exports of a (user, crop, date selection): the sample rows and the
+    daily N/P/K means over those dates. dates are date codes (None = all dates).
+    """
+    samples = metrics.select_dates(crop_df, index, dates)
+    samples = samples.drop(columns=[c for c in HIDDEN_COLUMNS if c in samples.columns])
+    trends = metrics.daily_means(crop_df, index)
+    if dates is not None:
+        trends = trends[trends['date'].isin(index['dates'][list(dates)])]
+    return samples, trends
+
+
+def _safe_name(value):
+    return re.sub(r'[^\w.-]+', '_', str(value)).strip('_') or 'unnamed'
+
+
+def selection_paths(data_version, user, crop, dates=None, fmt='csv'):
+    """Where the exports of one selection are kept (reused until the data version changes)."""
+    digest = hashlib.sha1(repr(dates).encode('utf-8')).hexdigest()[:10]
+    base = os.path.join(EXPORT_DIR, data_version or 'flat', f"{_safe_name(user)}_{_safe_name(crop)}_{digest}")
+    ext = EXTENSIONS[fmt]
+    return base + '_samples' + ext, base + '_trends' + ext
+
+
+def touch(data_version):
+    """Marks a version's exports as in use (see prune)."""
+    path = os.path.join(EXPORT_DIR, data_version or 'flat')
+    if os.path.isdir(path):
+        os.utime(path)
+
+
+def prune(keep_version, max_age=MAX_AGE_SECONDS):
+    """Removes exports of other data versions that haven't been used for max_age seconds."""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    now = time.time()
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if name == (keep_version or 'flat'):
+            continue
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def export_all(out_dir, fmt='csv', data_dir=None):
+    """Batch export: <out_dir>/<user>/<crop>_samples and <crop>_trends for every grower and crop."""
+    samples_df = dataset.read_samples(data_dir or data_store.current_dir())
+    if samples_df.empty:
+        print("No data to export.")
+        return 0
+
+    written = 0
+    for (user, crop), crop_df in samples_df.groupby(['username', 'crop'], sort=True):
+        index = metrics.build_slice_index(crop_df)
+        samples, trends = export_frames(crop_df, index)
+        user_dir = os.path.join(out_dir, _safe_name(user))
+        if not os.path.exists(user_dir):
+            os.makedirs(user_dir)
+        ext = EXTENSIONS[fmt]
+        write(samples, os.path.join(user_dir, f"{_safe_name(crop)}_samples{ext}"), fmt)
+        write(trends, os.path.join(user_dir, f"{_safe_name(crop)}_trends{ext}"), fmt)
+        written += 1
+        print(f"Exported {user} / {crop}: {len(samples)} samples, {len(trends)} dates")
+    print(f"Exported {written} grower/crop pairs to {out_dir}")
+    return written
+
+
+if __name__ == "__main__":
+    # python export.py [OUT_DIR] [--parquet]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    export_all(args[0] if args else 'exports', fmt='parquet' if '--parquet' in sys.argv else 'csv')
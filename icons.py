@@ -0,0 +1,81 @@
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional; the index falls back to the originals
+    Image = None
+
+# Configuration
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+THUMBS_DIR = os.path.join(ASSETS_DIR, 'thumbs')
+
+# The crop selector shows icons at width=350
+THUMB_SIZE = 350
+THUMB_QUALITY = 85
+ICON_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+
+def _thumb_path(file_name, thumbs_dir=THUMBS_DIR):
+    return os.path.join(thumbs_dir, os.path.splitext(file_name)[0] + '.webp')
+
+
+def build_thumbnails(assets_dir=ASSETS_DIR, thumbs_dir=THUMBS_DIR, size=THUMB_SIZE):
+    """
+    Writes a right-sized, compressed WebP next to every icon in assets/ (assets/thumbs/).
+    Only icons newer than their thumbnail are processed. Returns the number written.
+    """
+    if Image is None:
+        print("Pillow not installed, skipping icon thumbnails.")
+        return 0
+    if not os.path.exists(thumbs_dir):
+        os.makedirs(thumbs_dir)
+
+    written = 0
+    for file_name in os.listdir(assets_dir):
+        src = os.path.join(assets_dir, file_name)
+        if not file_name.lower().endswith(ICON_EXTENSIONS) or file_name.startswith('.') or not os.path.isfile(src):
+            continue
+        dest = _thumb_path(file_name, thumbs_dir)
+        # Thumbnails carry their source's mtime, so any change (even to an older file) rebuilds
+        src_mtime = os.path.getmtime(src)
+        if os.path.exists(dest) and os.path.getmtime(dest) == src_mtime:
+            continue
+        try:
+            with Image.open(src) as img:
+                img = img.convert('RGBA') if img.mode in ('P', 'LA', 'RGBA') else img.convert('RGB')
+                img.thumbnail((size, size), Image.LANCZOS)
+                tmp_path = dest + '.tmp'
+                img.save(tmp_path, format='WEBP', quality=THUMB_QUALITY, method=6)
+            os.utime(tmp_path, (src_mtime, src_mtime))
+            os.replace(tmp_path, dest)
+            written += 1
+        except Exception as e:
+            print(f"Could not create thumbnail for {file_name}: {e}")
+    if written:
+        print(f"Created {written} icon thumbnails.")
+    return written
+
+
+def index_signature(assets_dir=ASSETS_DIR, thumbs_dir=THUMBS_DIR):
+    """Cheap cache key for the icon index (changes when icons are added or replaced)."""
+    signature = []
+    for d in (assets_dir, thumbs_dir):
+        signature.append(os.path.getmtime(d) if os.path.exists(d) else 0)
+    return tuple(signature)
+
+
+def build_icon_index(assets_dir=ASSETS_DIR, thumbs_dir=THUMBS_DIR):
+    """
+    Maps lower-cased icon names (without extension) to the file to display,
+    preferring the thumbnail over the full-size original.
+    """
+    index = {}
+    if os.path.exists(assets_dir):
+        for file_name in os.listdir(assets_dir):
+            if file_name.lower().endswith(ICON_EXTENSIONS) and not file_name.startswith('.'):
+                index.setdefault(os.path.splitext(file_name)[0].lower(), os.path.join(assets_dir, file_name))
+    if os.path.exists(thumbs_dir):
+        for file_name in os.listdir(thumbs_dir):
+            if file_name.lower().endswith('.webp'):
+                index[os.path.splitext(file_name)[0].lower()] = os.path.join(thumbs_dir, file_name)
+    return index
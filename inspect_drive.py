@@ -1,47 +1,40 @@
-
 import os
+import sys
 import setup_auth
 import auth_utils
-from googleapiclient.discovery import build
+import drive_cache
+import drive_client
 
-def inspect_drive():
+def inspect_drive(force=False):
     creds = auth_utils.get_creds()
     if not creds:
         print("No credentials found. running setup...")
         setup_auth.setup()
         creds = auth_utils.get_creds()
 
-    service = build('drive', 'v3', credentials=creds)
+    service = drive_client.get_service(creds)
     
-    FOLDER_NAME = "data app NPK"
+    FOLDER_NAME = drive_cache.DRIVE_FOLDER_NAME
     
     print(f"Searching for folder: {FOLDER_NAME}")
-    results = service.files().list(
-        q=f"name = '{FOLDER_NAME}' and mimeType = 'application/vnd.google-apps.folder'",
-        fields="files(id, name)"
-    ).execute()
+    inventory = drive_cache.get_inventory(service, FOLDER_NAME, force=force)
     
-    folders = results.get('files', [])
-    if not folders:
+    if not inventory:
         print("Folder not found.")
         return
 
-    folder_id = folders[0]['id']
+    folder_id = inventory['folders']['root']
     print(f"Found folder ID: {folder_id}")
     
-    # Recursive helper
+    # Recursive helper (walks the cached tree listing)
     def list_folder(f_id, indent=""):
-        results = service.files().list(
-            q=f"'{f_id}' in parents and trashed = false",
-            fields="files(id, name, mimeType)"
-        ).execute()
-        files = results.get('files', [])
+        files = drive_cache.children_of(inventory, f_id)
         for f in files:
             print(f"{indent} - {f['name']} ({f['mimeType']}) ID: {f['id']}")
-            if f['mimeType'] == 'application/vnd.google-apps.folder':
+            if f['mimeType'] == drive_cache.FOLDER_MIME:
                 list_folder(f['id'], indent + "   ")
 
     list_folder(folder_id)
 
 if __name__ == "__main__":
-    inspect_drive()
+    inspect_drive(force="--refresh" in sys.argv)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import ranges
+
+ELEMENTS = ranges.ELEMENTS
+
+# Columns the raw table's text filter searches
+TABLE_SEARCH_COLUMNS = ['site', 'sample']
+
+
+def build_slice_index(crop_df):
+    """
+    Integer codes for the dates and sites of a (user, crop) slice, plus each date's
+    row positions stored contiguously (CSR-style offsets into `date_rows`), so date
+    selection and site highlighting are integer operations instead of string and
+    timestamp comparisons. Row positions are relative to crop_df.
+    """
+    date_codes, dates = pd.factorize(crop_df['date'], sort=True)
+    site_codes, sites = pd.factorize(crop_df['site'], sort=True)
+    date_rows = np.argsort(date_codes, kind='stable')
+    # Rows without a date (code -1) sort first and fall outside every offset range
+    date_offsets = np.searchsorted(date_codes[date_rows], np.arange(len(dates) + 1))
+    return {
+        'dates': dates,
+        'date_labels': [d.strftime('%d/%m/%y') for d in dates],
+        'date_codes': date_codes.astype(np.int32),
+        'date_rows': date_rows,
+        'date_offsets': date_offsets,
+        'sites': list(sites),
+        # Clicked sites come back from the chart as strings
+        'site_lookup': {str(site): code for code, site in enumerate(sites)},
+        'site_codes': site_codes.astype(np.int32),
+    }
+
+
+def date_mask(index, codes=None):
+    """Boolean row mask for the union of the selected date codes (None = every row)."""
+    n_rows = len(index['date_codes'])
+    if codes is None:
+        return np.ones(n_rows, dtype=bool)
+    mask = np.zeros(n_rows, dtype=bool)
+    rows, offsets = index['date_rows'], index['date_offsets']
+    for code in codes:
+        mask[rows[offsets[code]:offsets[code + 1]]] = True
+    return mask
+
+
+def site_mask(index, site):
+    """Boolean row mask for one site (all False if the slice has no such site)."""
+    code = index['site_lookup'].get(str(site), -2)
+    return index['site_codes'] == code
+
+
+def select_dates(crop_df, index, codes=None):
+    """Rows sampled on any of the date codes (None = all dates)."""
+    if codes is None:
+        return crop_df
+    return crop_df[date_mask(index, codes)]
+
+
+def daily_means(crop_df, index, site=None):
+    """Per-date mean N/P/K, for one site or the whole crop, sorted by date."""
+    codes = index['date_codes']
+    if site is not None:
+        rows = site_mask(index, site)
+        crop_df, codes = crop_df[rows], codes[rows]
+    # Grouping by the integer date code keeps date order without sorting timestamps
+    means = crop_df[ELEMENTS].groupby(codes).mean()
+    means = means[means.index >= 0]
+    means.insert(0, 'date', index['dates'][means.index.to_numpy()])
+    return means.reset_index(drop=True)
+
+
+def kpis(df):
+    """
+    Headline numbers for a selection: sample count, mean per element and the
+    share of samples with every element inside its optimal range (read from the
+    precomputed status columns, see ranges.status_matrix).
+    """
+    count = len(df)
+    result = {'count': count}
+    for element in ELEMENTS:
+        result[f'mean_{element}'] = float(df[element].mean()) if count else float('nan')
+    all_opt = (df[ranges.STATUS_COLUMNS].to_numpy() == ranges.OK).all(axis=1)
+    result['pct_optimal'] = (all_opt.sum() / count) * 100 if count else 0
+    return result
+
+
+def table_order(df, sort_by=None, ascending=True, query=None):
+    """
+    Row positions of df for the raw data table: rows whose site or sample contains
+    `query` (case-insensitive), ordered by `sort_by` (stable, missing values last).
+    """
+    positions = np.arange(len(df))
+    if query:
+        query = str(query).strip().lower()
+        hit = np.zeros(len(df), dtype=bool)
+        for col in TABLE_SEARCH_COLUMNS:
+            if col in df.columns:
+                hit |= df[col].astype(str).str.lower().str.contains(query, regex=False).to_numpy()
+        positions = positions[hit]
+    if sort_by and sort_by in df.columns:
+        keys = df[sort_by].iloc[positions].reset_index(drop=True)
+        order = keys.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+        positions = positions[order]
+    return positions
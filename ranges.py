@@ -0,0 +1,122 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Synced alongside the sample files, but not sample data itself
+RANGES_FILE = 'ranges.csv'
+
+ELEMENTS = ['N', 'P', 'K']
+BOUND_COLUMNS = [f'{element}_{bound}' for element in ELEMENTS for bound in ('min', 'max')]
+STATUS_COLUMNS = [f'{element}_status' for element in ELEMENTS]
+
+# Fallback for crops (or elements) that ranges.csv doesn't cover
+DEFAULT_RANGES = {
+    'N': (1.6, 2.2),
+    'P': (0.06, 0.12),
+    'K': (0.6, 1.0)
+}
+
+# Values in the status matrix
+LOW, OK, HIGH = -1, 0, 1
+
+
+def _key(series):
+    return series.fillna('').astype(str).str.strip().str.lower()
+
+
+def load_ranges(data_dir):
+    """
+    Reads ranges.csv from a data snapshot: one row per crop, optionally per growth
+    stage (blank stage = whole crop), with N_min, N_max, P_min, P_max, K_min, K_max.
+    Blank bounds fall back to DEFAULT_RANGES. Returns an empty frame if the file is
+    missing or unusable.
+    """
+    path = os.path.join(data_dir, RANGES_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        table = pd.read_csv(path)
+    except Exception as e:
+        print(f"Error reading {RANGES_FILE}: {e}")
+        return pd.DataFrame()
+
+    table.columns = table.columns.str.strip()
+    missing = [c for c in ['crop'] + BOUND_COLUMNS if c not in table.columns]
+    if missing:
+        print(f"{RANGES_FILE} is missing columns {missing}, using default ranges.")
+        return pd.DataFrame()
+
+    table['crop'] = _key(table['crop'])
+    table['stage'] = _key(table['stage']) if 'stage' in table.columns else ''
+    for col in BOUND_COLUMNS:
+        table[col] = pd.to_numeric(table[col], errors='coerce')
+    return table.drop_duplicates(['crop', 'stage'], keep='last')
+
+
+def ranges_for(table, crop, stage=None):
+    """
+    (min, max) per element for a crop, with a stage row overriding the crop-wide one.
+    Each bound falls back on its own, exactly as in row_limits.
+    """
+    result = dict(DEFAULT_RANGES)
+    if table is None or table.empty:
+        return result
+    rows = table[table['crop'] == str(crop).strip().lower()]
+    layers = [rows[rows['stage'] == '']]
+    if stage:
+        layers.append(rows[rows['stage'] == str(stage).strip().lower()])
+    for layer in layers:
+        if layer.empty:
+            continue
+        row = layer.iloc[0]
+        for element in ELEMENTS:
+            min_lim, max_lim = result[element]
+            if pd.notna(row[f'{element}_min']):
+                min_lim = float(row[f'{element}_min'])
+            if pd.notna(row[f'{element}_max']):
+                max_lim = float(row[f'{element}_max'])
+            result[element] = (min_lim, max_lim)
+    return result
+
+
+def row_limits(df, table=None):
+    """
+    Per-row bounds: two float arrays (mins, maxs) of shape (len(df), 3), columns in
+    ELEMENTS order. Defaults, then crop-wide rows, then crop+stage rows are layered.
+    """
+    n_rows = len(df)
+    mins = np.tile([DEFAULT_RANGES[e][0] for e in ELEMENTS], (n_rows, 1)).astype(float)
+    maxs = np.tile([DEFAULT_RANGES[e][1] for e in ELEMENTS], (n_rows, 1)).astype(float)
+    if table is None or table.empty or 'crop' not in df.columns:
+        return mins, maxs
+
+    keys = pd.DataFrame({'crop': _key(df['crop']).to_numpy()})
+    layers = [(['crop'], table[table['stage'] == ''])]
+    if 'stage' in df.columns:
+        keys['stage'] = _key(df['stage']).to_numpy()
+        layers.append((['crop', 'stage'], table[table['stage'] != '']))
+
+    for on, layer in layers:
+        if layer.empty:
+            continue
+        # Left merge on unique keys keeps the rows in df order
+        matched = keys[on].merge(layer[on + BOUND_COLUMNS], on=on, how='left')
+        for i, element in enumerate(ELEMENTS):
+            for target, bound in ((mins, 'min'), (maxs, 'max')):
+                values = matched[f'{element}_{bound}'].to_numpy(dtype=float)
+                found = ~np.isnan(values)
+                target[found, i] = values[found]
+    return mins, maxs
+
+
+def status_matrix(df, table=None):
+    """
+    Evaluates N, P and K of every row against its crop's ranges in one vectorized
+    pass. Returns an int8 array of shape (len(df), 3) holding LOW, OK or HIGH.
+    """
+    values = df[ELEMENTS].to_numpy(dtype=float)
+    mins, maxs = row_limits(df, table)
+    status = np.full(values.shape, OK, dtype=np.int8)
+    status[values < mins] = LOW
+    status[values > maxs] = HIGH
+    return status
@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+# Configuration
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'sheet_exports')
+INDEX_FILE = os.path.join(CACHE_DIR, 'index.json')
+
+_lock = threading.Lock()
+
+
+def revision_key(file_meta):
+    """Identifies one revision of a sheet: Drive 'version' plus 'modifiedTime'."""
+    version = file_meta.get('version')
+    modified = file_meta.get('modifiedTime')
+    if not version and not modified:
+        return None
+    return f"{version or ''}|{modified or ''}"
+
+
+def _load_index():
+    if not os.path.exists(INDEX_FILE):
+        return {}
+    try:
+        with open(INDEX_FILE, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading sheet export cache index: {e}")
+        return {}
+
+
+def _write_atomic(path, data, mode='w'):
+    """Writes via a unique temp file + rename (other processes may write the same file)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _save_index(index):
+    _write_atomic(INDEX_FILE, lambda f: json.dump(index, f))
+
+
+def _export_path(file_id):
+    return os.path.join(CACHE_DIR, f"{file_id}.csv")
+
+
+def lookup(file_meta):
+    """Returns the path of a cached CSV export for this exact revision, or None."""
+    key = revision_key(file_meta)
+    if not key:
+        return None
+    with _lock:
+        entry = _load_index().get(file_meta['id'])
+    path = _export_path(file_meta['id'])
+    if entry and entry.get('revision') == key and os.path.exists(path):
+        return path
+    return None
+
+
+def store(file_meta, data):
+    """Saves a fresh CSV export (bytes) for this revision, replacing older ones."""
+    key = revision_key(file_meta)
+    if not key:
+        return
+    with _lock:
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        path = _export_path(file_meta['id'])
+        _write_atomic(path, data, 'wb')
+        index = _load_index()
+        index[file_meta['id']] = {'revision': key, 'name': file_meta.get('name'), 'bytes': len(data)}
+        _save_index(index)
+
+
+def copy_to(cached_path, dest_path):
+    """Copies a cached export to its destination (temp file + rename) and returns the byte count."""
+    with open(cached_path, 'rb') as src:
+        _write_atomic(dest_path, lambda f: shutil.copyfileobj(src, f), 'wb')
+    return os.path.getsize(dest_path)
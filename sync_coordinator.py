@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import concurrent.futures
+import sync_data
+import sync_telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process single-flight applies
+    fcntl = None
+
+# Configuration
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+LOCK_FILE = os.path.join(CACHE_DIR, 'sync.lock')
+RESULT_FILE = os.path.join(CACHE_DIR, 'sync_result.json')
+
+# A sync that finished less than this many seconds ago is handed out as-is
+FRESH_SECONDS = 30
+
+_state_lock = threading.Lock()
+_inflight = None
+# Held while this process runs any sync (flock alone doesn't exist on Windows)
+_sync_lock = threading.Lock()
+
+
+def _read_result():
+    if not os.path.exists(RESULT_FILE):
+        return None
+    try:
+        with open(RESULT_FILE, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _write_result(success, message, started_at):
+    record = {'success': bool(success), 'message': message, 'started_at': started_at, 'finished_at': time.time()}
+    tmp_path = RESULT_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, RESULT_FILE)
+
+
+def _fresh_result(since, failed_too=False):
+    """
+    Returns (success, message) of a sync that finished after `since`, or None.
+    Failures only count with failed_too, so a retry right after a failure really syncs.
+    """
+    last = _read_result()
+    if last and last.get('finished_at', 0) >= since and (last['success'] or failed_too):
+        return last['success'], last['message']
+    return None
+
+
+def run_sync(creds=None, sync_fn=None, fresh_seconds=FRESH_SECONDS, on_event=None):
+    """
+    Runs sync_data.sync_data at most once at a time, across threads and processes.
+    Callers that arrive while a sync is running share its result instead of
+    starting another; callers arriving within `fresh_seconds` of a successful sync
+    get that result directly. Returns (success, message).
+
+    on_event receives the sync's progress events when this caller runs the sync;
+    callers that join someone else's sync only get a 'waiting' phase and 'done'.
+    """
+    global _inflight
+    if sync_fn is None:
+        sync_fn = sync_data.sync_data
+    emit = sync_telemetry.emitter(on_event)
+    requested_at = time.time()
+
+    recent = _fresh_result(requested_at - fresh_seconds)
+    if recent:
+        print("Sync finished moments ago, reusing its result.")
+        emit('done', success=recent[0], message=recent[1])
+        return recent
+
+    # 1. In-process single flight: join the sync already running in this process
+    with _state_lock:
+        if _inflight is not None:
+            future = _inflight
+            leader = False
+        else:
+            future = concurrent.futures.Future()
+            _inflight = future
+            leader = True
+
+    if not leader:
+        print("Sync already running, waiting for it...")
+        emit('phase', phase='waiting')
+        result = future.result()
+        emit('done', success=result[0], message=result[1])
+        return result
+
+    try:
+        result = _run_locked(creds, sync_fn, requested_at, fresh_seconds, on_event)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _state_lock:
+            _inflight = None
+
+
+@contextlib.contextmanager
+def _exclusive(emit):
+    """
+    Holds the sync locks: in-process (full syncs and lazy fetches of this process)
+    and the cross-process file lock. Yields True if another process held it first.
+    """
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+
+    with _sync_lock, open(LOCK_FILE, 'a+') as lock_fh:
+        waited = False
+        if fcntl:
+            try:
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print("Another process is syncing, waiting for it...")
+                emit('phase', phase='waiting')
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX)
+                waited = True
+        try:
+            yield waited
+        finally:
+            if fcntl:
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_UN)
+
+
+def _call(sync_fn, creds, on_event):
+    result = sync_fn(creds, on_event=on_event) if on_event else sync_fn(creds)
+    if isinstance(result, tuple):
+        return result
+    return result, ""
+
+
+def _run_locked(creds, sync_fn, requested_at, fresh_seconds, on_event=None):
+    """Runs the sync under the cross-process file lock."""
+    emit = sync_telemetry.emitter(on_event)
+    with _exclusive(emit) as waited:
+        if waited:
+            # 2. Another process synced while we waited: take its result
+            # (that sync started after we asked, so even its failure is a current answer)
+            joined = _fresh_result(requested_at, failed_too=True)
+            if joined:
+                emit('done', success=joined[0], message=joined[1])
+                return joined
+
+        # A sync may have finished between the first check and taking the lock
+        recent = _fresh_result(requested_at - fresh_seconds)
+        if recent:
+            emit('done', success=recent[0], message=recent[1])
+            return recent
+
+        started_at = time.time()
+        success, message = _call(sync_fn, creds, on_event)
+        _write_result(success, message, started_at)
+        return success, message
+
+
+def run_partial(sync_fn, creds=None, on_event=None):
+    """
+    Runs a filtered (lazy) fetch under the same locks as run_sync, so it never
+    overlaps a full sync or another fetch. A full sync already running in this
+    process is joined instead, since its snapshot holds every file. Partial
+    results are not recorded, so they never stand in for a full sync.
+    """
+    emit = sync_telemetry.emitter(on_event)
+    with _state_lock:
+        future = _inflight
+    if future is not None:
+        print("Full sync already running, waiting for it instead of fetching...")
+        emit('phase', phase='waiting')
+        result = future.result()
+        emit('done', success=result[0], message=result[1])
+        return result
+
+    with _exclusive(emit):
+        return _call(sync_fn, creds, on_event)
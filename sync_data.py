@@ -1,11 +1,25 @@
 import os
 import io
 import shutil
+import re
+import sys
+import hashlib
+import subprocess
+import tempfile
+import threading
+import time
 import pandas as pd
-from googleapiclient.discovery import build
+import drive_client
 from googleapiclient.http import MediaIoBaseDownload
 import auth_utils
 import setup_auth
+import drive_cache
+import drive_api
+import sync_telemetry
+import sheet_cache
+import data_store
+import icons
+import ranges
 import concurrent.futures
 import dateutil.parser
 import datetime
@@ -24,7 +38,16 @@ def ensure_dirs():
     if not os.path.exists(LOCAL_ASSETS_DIR):
         os.makedirs(LOCAL_ASSETS_DIR)
 
-def sync_from_local_drive():
+# Local sync settings
+LOCAL_SYNC_WORKERS = 4
+# 'copy' or 'reflink' (a copy-on-write clone, when source and destination share a filesystem).
+# No hardlinks from the source tree: editing a source file in place would change a published
+# snapshot under the same version id (hardlinks are only used between snapshots, see carry_forward).
+LOCAL_SYNC_MODE = 'copy'
+# Compare file contents too, not just size + mtime (slower over the Drive mount)
+LOCAL_SYNC_HASH = False
+
+def sync_from_local_drive(mode=LOCAL_SYNC_MODE, use_hash=LOCAL_SYNC_HASH, workers=LOCAL_SYNC_WORKERS):
     """Syncs data and icons directly from the local Google Drive folder."""
     print(f"Checking local Drive path: {USER_DRIVE_PATH}")
     if not os.path.exists(USER_DRIVE_PATH):
@@ -33,68 +56,172 @@ def sync_from_local_drive():
         
     print("Found local Drive folder! Syncing via file copy...")
     ensure_dirs()
+    telemetry = sync_telemetry.SyncTelemetry('local')
     
-    # 1. Sync Data (CSVs)
-    # Recursively find CSVs in the local Drive folder
-    # We want CSVs from 'GrowerNutritionMonitor' folder mainly? Or root?
-    # Previous logic searched recursively from root.
-    
-    # Let's walk the USER_DRIVE_PATH
-    data_count = 0
+    # 1. Collect Data (CSVs)
+    # Recursively find CSVs in the local Drive folder (same name twice: last one found wins).
+    # Each job compares against the current snapshot and writes into a new staging version.
+    previous_dir = data_store.current_dir()
+    version_id, staging_dir = data_store.begin_version()
+    data_sources = {}
     for root, dirs, files in os.walk(USER_DRIVE_PATH):
         for file in files:
             if file.endswith('.csv') and not file.startswith('.'):
-                src_path = os.path.join(root, file)
-                dest_path = os.path.join(LOCAL_DATA_DIR, file)
-                
-                # Copy if newer or missing
-                if should_copy(src_path, dest_path):
-                    try:
-                        shutil.copy2(src_path, dest_path)
-                        print(f"Copied Data: {file}")
-                        data_count += 1
-                    except Exception as e:
-                        print(f"Error copying {file}: {e}")
-    
-    print(f"Synced {data_count} data files.")
+                data_sources[file] = os.path.join(root, file)
+    data_jobs = [
+        (src_path, os.path.join(previous_dir, file), os.path.join(staging_dir, file))
+        for file, src_path in data_sources.items()
+    ]
 
-    # 2. Sync Icons from 'GrowerNutritionMonitor/www'
-    # We need to find where 'www' is relative to USER_DRIVE_PATH
-    # USER_DRIVE_PATH ends in 'data app NPK'
+    # 2. Collect Icons from 'GrowerNutritionMonitor/www'
     # The structure is 'data app NPK' -> 'GrowerNutritionMonitor' -> 'www'
-    
+    icon_jobs = []
     www_path = os.path.join(USER_DRIVE_PATH, 'GrowerNutritionMonitor', 'www')
     if os.path.exists(www_path):
-        icon_count = 0
         for file in os.listdir(www_path):
             if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')) and not file.startswith('.'):
-                src_path = os.path.join(www_path, file)
                 dest_path = os.path.join(LOCAL_ASSETS_DIR, file)
-                
-                if should_copy(src_path, dest_path):
-                    try:
-                        shutil.copy2(src_path, dest_path)
-                        print(f"Copied Icon: {file}")
-                        icon_count += 1
-                    except Exception as e:
-                        print(f"Error copying icon {file}: {e}")
-        print(f"Synced {icon_count} icons.")
+                icon_jobs.append((os.path.join(www_path, file), dest_path, dest_path))
     else:
         print(f"Warning: 'www' folder not found at {www_path}")
 
-    return True
+    # 3. Compare + copy in a small worker pool (stat/read over the Drive mount is slow)
+    def sync_one(job):
+        src_path, previous_path, dest_path = job
+        file = os.path.basename(src_path)
+        t_start = time.perf_counter()
+        try:
+            changed = should_copy(src_path, previous_path, use_hash=use_hash)
+            # Comparing reads the Drive mount, so it counts as the "download" side
+            compare_seconds = time.perf_counter() - t_start
+            if not changed:
+                if previous_path != dest_path:
+                    # Unchanged: reuse the previous snapshot's copy in the new version
+                    data_store.carry_forward(os.path.dirname(dest_path), file, os.path.dirname(previous_path))
+                telemetry.record_file(file, download_seconds=compare_seconds, status='skipped')
+                return False
+            t_copy = time.perf_counter()
+            how = copy_file(src_path, dest_path, mode=mode)
+            telemetry.record_file(
+                file, nbytes=os.path.getsize(dest_path), download_seconds=compare_seconds,
+                write_seconds=time.perf_counter() - t_copy
+            )
+            print(f"Copied ({how}): {file}")
+            return True
+        except Exception as e:
+            print(f"Error copying {file}: {e}")
+            telemetry.record_file(file, download_seconds=time.perf_counter() - t_start, status='failed', error=e)
+            if previous_path != dest_path and not os.path.exists(dest_path):
+                # Keep the last good copy so the new snapshot stays complete
+                data_store.carry_forward(os.path.dirname(dest_path), file, os.path.dirname(previous_path))
+            return False
 
-def should_copy(src, dest):
-    """Returns True if src is newer or dest is missing."""
-    # For local sync, we want to enforce the source as truth, especially if dimensions/content changed but mtime is older on source (e.g. restored file).
-    # Also to fix the issue where a previous download created a 'newer' file than the source.
-    # To be safe and ensure 'Reload' actually reloads:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        data_results = list(executor.map(sync_one, data_jobs))
+        icon_results = list(executor.map(sync_one, icon_jobs))
+
+    # 4. Publish the new data snapshot (atomic pointer swap)
+    previous_names = {f for f in os.listdir(previous_dir) if f.endswith('.csv')} if os.path.isdir(previous_dir) else set()
+    if any(data_results) or previous_names != set(data_sources) or data_store.current_version() is None:
+        data_store.publish(version_id, staging_dir)
+    else:
+        # Nothing changed: keep the current version
+        data_store.discard(staging_dir)
+
+    print(f"Synced {sum(data_results)} of {len(data_jobs)} data files.")
+    print(f"Synced {sum(icon_results)} of {len(icon_jobs)} icons.")
+    icons.build_thumbnails(LOCAL_ASSETS_DIR)
+    telemetry.finish(True, f"Local sync: {sum(data_results)} data files, {sum(icon_results)} icons copied.")
     return True
-    
-    # Original logic was:
-    # if not os.path.exists(dest):
-    #    return True
-    # return os.path.getmtime(src) > os.path.getmtime(dest)
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def should_copy(src, dest, use_hash=False):
+    """Returns True if dest is missing or differs from src."""
+    if not os.path.exists(dest):
+        return True
+    src_stat = os.stat(src)
+    dest_stat = os.stat(dest)
+    if src_stat.st_size != dest_stat.st_size:
+        return True
+    if use_hash:
+        return file_digest(src) != file_digest(dest)
+    # copy2/links preserve mtime, so any difference (newer OR older, e.g. a restored
+    # file on Drive) means the source is not what we copied last time.
+    return int(src_stat.st_mtime) != int(dest_stat.st_mtime)
+
+def _same_filesystem(src, dest):
+    return os.stat(src).st_dev == os.stat(os.path.dirname(dest)).st_dev
+
+def _reflink(src, dest):
+    """Copy-on-write clone. Raises OSError if the filesystem can't do it."""
+    if sys.platform == 'darwin':
+        # APFS clone
+        subprocess.run(['cp', '-c', src, dest], check=True, capture_output=True)
+        return
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, 'rb') as s, open(dest, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dest)
+
+def temp_path(dest):
+    """
+    A new, unique temp file next to dest (same filesystem, so os.replace is atomic).
+    Writing there and replacing dest never writes through a hardlink dest may be.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest) or '.', prefix=os.path.basename(dest) + '.', suffix='.part')
+    os.close(fd)
+    return tmp_path
+
+def write_file(dest, data):
+    """Writes bytes to dest via a temp file + rename."""
+    tmp_path = temp_path(dest)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def copy_file(src, dest, mode='copy'):
+    """
+    Copies src over dest via a temp file + rename, so readers never see a half-written file.
+    'reflink' is tried first when both paths share a filesystem, falling back to a
+    normal copy. Returns the method actually used.
+    """
+    if mode == 'hardlink':
+        # dest must not share an inode with a file that can still change
+        print("Hardlinks are not used for source files, copying instead.")
+    tmp_path = temp_path(dest)
+    try:
+        if mode == 'reflink' and _same_filesystem(src, dest):
+            # The clone needs a path that doesn't exist yet
+            os.remove(tmp_path)
+            try:
+                _reflink(src, tmp_path)
+                os.replace(tmp_path, dest)
+                return mode
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"{mode} not possible for {os.path.basename(src)} ({e}), copying instead.")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dest)
+        return 'copy'
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 # Wrapper functions for compatibility with app.py calls
 # Wrapper functions for compatibility with app.py calls
@@ -105,41 +232,42 @@ def sync_icons_only(creds=None):
     
     if creds:
         try:
-            service = build('drive', 'v3', credentials=creds)
-            sync_icons_api(service)
+            with drive_client.client(creds) as service:
+                sync_icons_api(service)
             return True
         except Exception as e:
             print(f"Icon Only Sync Failed: {e}")
             return False
     return False
 
-def sync_data(creds=None):
-    """Syncs data using API."""
-    return sync_data_api(creds)
+def sync_data(creds=None, on_event=None):
+    """Syncs data using API. on_event(event) receives progress events (see sync_telemetry.emitter)."""
+    return sync_data_api(creds, on_event=on_event)
 
 # --- API SYNC IMPLEMENTATION ---
-def sync_icons_api(service):
+def sync_icons_api(service, inventory=None, telemetry=None, on_event=None):
     """Syncs icons from Drive using API with parallel downloads."""
     print("Syncing icons via API...")
+    emit = sync_telemetry.emitter(on_event)
+    emit('phase', phase='icons')
+    # Standalone icon syncs get their own telemetry run
+    own_telemetry = telemetry is None
+    if own_telemetry:
+        telemetry = sync_telemetry.SyncTelemetry('icons')
+    success = False
     try:
-        # 1. Find root
-        results = service.files().list(q=f"name = '{DRIVE_FOLDER_NAME}' and mimeType = 'application/vnd.google-apps.folder'", fields="files(id)").execute()
-        if not results.get('files'): return
-        root_id = results.get('files')[0]['id']
-
-        # 2. Find GrowerNutritionMonitor
-        results = service.files().list(q=f"'{root_id}' in parents and name = 'GrowerNutritionMonitor' and mimeType = 'application/vnd.google-apps.folder'", fields="files(id)").execute()
-        if not results.get('files'): return
-        gnm_id = results.get('files')[0]['id']
-
-        # 3. Find www
-        results = service.files().list(q=f"'{gnm_id}' in parents and name = 'www' and mimeType = 'application/vnd.google-apps.folder'", fields="files(id)").execute()
-        if not results.get('files'): return
-        www_id = results.get('files')[0]['id']
-
-        # 4. List images with modifiedTime
-        results = service.files().list(q=f"'{www_id}' in parents and (mimeType contains 'image/')", fields="files(id, name, modifiedTime)").execute()
-        files = results.get('files', [])
+        # 1. Resolve 'www' from the cached Drive inventory
+        if inventory is None:
+            t_list = time.perf_counter()
+            with drive_api.retry_listener(telemetry.on_retry):
+                inventory = drive_cache.get_inventory(service, DRIVE_FOLDER_NAME)
+            telemetry.record_list(time.perf_counter() - t_list)
+        if not inventory: return
+        www_id = inventory['folders'].get('www')
+        if not www_id: return
+
+        # 2. Images with modifiedTime
+        files = [f for f in drive_cache.children_of(inventory, www_id) if 'image/' in f['mimeType']]
         
         # Deduplicate icons (Use newest version)
         unique_icons = {}
@@ -161,65 +289,92 @@ def sync_icons_api(service):
             os.makedirs(LOCAL_ASSETS_DIR)
 
         def download_icon_wrapper(f):
-             download_file(service, f['id'], f['name'], dest_folder=LOCAL_ASSETS_DIR, file_meta=f)
+             # Services are not thread-safe: each download checks out its own pooled client
+             with drive_client.client_like(service) as own_service:
+                 return download_file(own_service, f['id'], f['name'],
+                                      dest_folder=LOCAL_ASSETS_DIR, file_meta=f, telemetry=telemetry)
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
             # Must iterate to catch exceptions!
+            # (Events are emitted here, on the caller's thread, never from the workers)
             results = executor.map(download_icon_wrapper, final_icons)
-            for _ in results: pass
+            for f, nbytes in zip(final_icons, results):
+                emit('file_done', name=f['name'], bytes=nbytes)
+
+        # 3. Right-sized thumbnails for the crop selector
+        icons.build_thumbnails(LOCAL_ASSETS_DIR)
+        success = True
 
     except Exception as e:
         print(f"Icon API Sync Failed: {e}")
+    finally:
+        if own_telemetry:
+            telemetry.finish(success, "Icon sync")
 
-def sync_data_api(creds=None):
-    """Syncs data from Google Drive using API with parallel downloads."""
+def sync_data_api(creds=None, on_event=None, only=None):
+    """
+    Syncs data from Google Drive using API with parallel downloads.
+    only(file_meta, inventory) -> bool restricts the sync to some files (lazy fetch);
+    everything else is carried over from the current snapshot and icons are skipped.
+    """
     print("Starting API Data Sync...")
     ensure_dirs()
-    
+    emit = sync_telemetry.emitter(on_event)
+    telemetry = sync_telemetry.SyncTelemetry('api' if only is None else 'api-partial')
+    try:
+        # Listing and other calls without their own retry callback count as run-level retries
+        with drive_api.retry_listener(telemetry.on_retry):
+            success, msg = _sync_data_api(creds, telemetry, emit, on_event, only)
+    except BaseException as e:
+        emit('done', success=False, message=f"API Error: {e}")
+        raise
+    telemetry.finish(success, msg)
+    emit('done', success=success, message=msg)
+    return success, msg
+
+def _sync_data_api(creds, telemetry, emit, on_event, only=None):
     if not creds:
         creds = auth_utils.get_creds()
         if not creds:
             print("No credentials found. Please log in.")
             return False, "No credentials found. Please check secrets."
 
+    if only is not None and data_store.is_complete():
+        # A full sync finished while this fetch waited for the lock
+        return True, "Full data snapshot already available."
+    base_version = data_store.current_version()
+
+    service = None
     try:
-        service = build('drive', 'v3', credentials=creds)
+        service = drive_client.get_service(creds)
+        telemetry.event('client', **drive_client.stats())
         
-        # 1. Find root folder
-        results = service.files().list(
-            q=f"name = '{DRIVE_FOLDER_NAME}' and mimeType = 'application/vnd.google-apps.folder'",
-            fields="files(id, name)"
-        ).execute()
-        items = results.get('files', [])
+        # 1. Load the Drive tree (cached on disk, rebuilt only when stale)
+        emit('phase', phase='listing')
+        t_list = time.perf_counter()
+        inventory = drive_cache.get_inventory(service, DRIVE_FOLDER_NAME)
+        telemetry.record_list(time.perf_counter() - t_list)
         
-        if not items:
+        if not inventory:
             print(f"Folder '{DRIVE_FOLDER_NAME}' not found.")
             return False, f"Folder '{DRIVE_FOLDER_NAME}' not found in Drive. Please verify the folder name."
         
-        root_folder_id = items[0]['id']
-        
         # 2. Collect files to download
         files_to_download = []
 
-        def process_folder(folder_id):
-            results = service.files().list(
-                q=f"'{folder_id}' in parents and trashed = false",
-                fields="files(id, name, mimeType, modifiedTime)"
-            ).execute()
-            files = results.get('files', [])
-            
-            for f in files:
-                name_lower = f['name'].lower()
-                if f['mimeType'] == 'application/vnd.google-apps.folder':
-                    process_folder(f['id'])
-                elif name_lower == 'users.csv' or name_lower == 'users':
-                     # Force name to be users.csv for the download
-                     f['save_as'] = 'users.csv'
-                     files_to_download.append(f)
-                elif f['name'].endswith('.csv') and 'users' not in name_lower:
-                     files_to_download.append(f)
-
-        process_folder(root_folder_id)
+        for f in drive_cache.iter_files(inventory):
+            f = dict(f)
+            name_lower = f['name'].lower()
+            if name_lower == 'users.csv' or name_lower == 'users':
+                 # Force name to be users.csv for the download
+                 f['save_as'] = 'users.csv'
+                 files_to_download.append(f)
+            elif name_lower in (ranges.RANGES_FILE, os.path.splitext(ranges.RANGES_FILE)[0]):
+                 # Optimal ranges table (may be kept as a Google Sheet)
+                 f['save_as'] = ranges.RANGES_FILE
+                 files_to_download.append(f)
+            elif f['name'].endswith('.csv') and 'users' not in name_lower:
+                 files_to_download.append(f)
         
         # Deduplicate
         unique_files = {}
@@ -240,77 +395,256 @@ def sync_data_api(creds=None):
                          unique_files[target_name] = f
         
         final_files_list = list(unique_files.values())
+        if only is not None:
+            final_files_list = [f for f in final_files_list if only(f, inventory)]
         print(f"Found {len(final_files_list)} unique API files to sync.")
+        emit('discovered', files=len(final_files_list),
+             bytes=sum(int(f.get('size', 0)) for f in final_files_list))
         
         if not final_files_list:
              return False, "Found folder but no CSV files inside."
 
-        # Sequential download to avoid SSL errors
+        # Sequential download to avoid SSL errors.
+        # Files go into a staging version that is published atomically once complete.
+        emit('phase', phase='downloading')
+        version_id, staging_dir = data_store.begin_version()
         failures = []
-        for f in final_files_list:
-             target_name = f.get('save_as', f['name'])
-             try:
-                 download_file(service, f['id'], target_name, file_meta=f)
-             except Exception as e:
-                 print(f"Failed to download {target_name}: {e}")
-                 failures.append(f"{target_name} ({e})")
-        
+        published_meta = {}
         try:
-             sync_icons_api(service)
-        except Exception as e:
-             print(f"Icon sync minor error: {e}")
+            for index, f in enumerate(final_files_list):
+                 target_name = f.get('save_as', f['name'])
+                 emit('file_start', name=target_name, index=index, total=len(final_files_list),
+                      size=int(f['size']) if f.get('size') else None)
+                 def report(bytes_done, bytes_total, name=target_name):
+                     emit('progress', name=name, bytes_done=bytes_done, bytes_total=bytes_total)
+                 try:
+                     nbytes = download_file(service, f['id'], target_name, dest_folder=staging_dir, file_meta=f,
+                                            telemetry=telemetry, on_progress=report)
+                     published_meta[target_name] = {'drive_id': f['id'], 'modifiedTime': f.get('modifiedTime')}
+                     emit('file_done', name=target_name, bytes=nbytes)
+                 except Exception as e:
+                     print(f"Failed to download {target_name}: {e}")
+                     failures.append(f"{target_name} ({e})")
+                     emit('failure', name=target_name, error=str(e))
+                     # Keep the last good copy so the new snapshot stays complete
+                     data_store.carry_forward(staging_dir, target_name)
+
+            if only is not None:
+                # Partial fetch: everything not fetched now comes from the current snapshot
+                previous = data_store.current_dir()
+                if os.path.isdir(previous):
+                    for name in os.listdir(previous):
+                        if name.endswith('.csv') and not os.path.exists(os.path.join(staging_dir, name)):
+                            data_store.carry_forward(staging_dir, name, previous)
+
+            emit('phase', phase='publishing')
+            # A full sync yields a complete snapshot; a partial one is only as complete as its base
+            complete = only is None or data_store.is_complete()
+            snapshot_names = [n for n in os.listdir(staging_dir) if n.endswith('.csv')]
+            if only is not None and data_store.current_version() != base_version and data_store.is_complete():
+                # Never replace a newer full snapshot with one built on an older base
+                print("A full snapshot was published during this fetch, discarding the partial one.")
+                data_store.discard(staging_dir)
+            elif published_meta:
+                data_store.publish(version_id, staging_dir, published_meta, complete=complete)
+            else:
+                data_store.discard(staging_dir)
+        except Exception:
+            data_store.discard(staging_dir)
+            raise
+        
+        if only is None:
+            try:
+                 sync_icons_api(service, inventory, telemetry=telemetry, on_event=on_event)
+            except Exception as e:
+                 print(f"Icon sync minor error: {e}")
         
         # Check if users.csv was found
         downloaded_names = [f.get('save_as', f['name']) for f in final_files_list]
+        users_found = 'users.csv' in downloaded_names or 'users.csv' in snapshot_names
+        
+        cache_note = _sheet_cache_note(telemetry)
         
         if failures:
-             return True, f"Sync partial. Failed: {failures}. Users found: {'users.csv' in downloaded_names}"
+             return True, f"Sync partial. Failed: {failures}. Users found: {users_found}{cache_note}"
 
-        if 'users.csv' not in downloaded_names:
-            return True, f"Sync complete, BUT 'users.csv' was missing! Found: {downloaded_names}"
+        if not users_found:
+            return True, f"Sync complete, BUT 'users.csv' was missing! Found: {downloaded_names}{cache_note}"
             
         print("API Sync Completed Successfully.")
-        return True, "Sync completed successfully."
+        return True, f"Sync completed successfully.{cache_note}"
 
     except Exception as e:
         print(f"API Sync Failed: {e}")
         return False, f"API Error: {str(e)}"
+    finally:
+        if service is not None:
+            drive_client.release(service)
 
-def download_file(service, file_id, file_name, dest_folder=LOCAL_DATA_DIR, file_meta=None):
-    """Downloads a file from Drive."""
-    """Downloads a file from Drive."""
-    """Downloads a file from Drive."""
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            if file_meta and file_meta.get('mimeType') == 'application/vnd.google-apps.spreadsheet':
-                 # Export Google Sheet as CSV
-                 request = service.files().export_media(fileId=file_id, mimeType='text/csv')
-                 # Force .csv extension if missing
-                 if not file_name.lower().endswith('.csv'):
-                     file_name += '.csv'
-            else:
-                 # Standard download
-                 request = service.files().get_media(fileId=file_id)
-                 
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-            
-            # Save to disk
-            filepath = os.path.join(dest_folder, file_name)
-            with open(filepath, "wb") as f:
-                f.write(fh.getbuffer())
-            print(f"Downloaded: {file_name}")
-            return # Success
-        except Exception as e:
-            print(f"Failed to download {file_name} (Attempt {attempt+1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise e
-            import time
-            time.sleep(1) # Wait before retry
+# --- LAZY FETCH (cloud cold start) ---
+def _is_users_file(f, inventory=None):
+    return f.get('save_as') == 'users.csv'
+
+def _known_usernames():
+    """Usernames from the current snapshot's users.csv."""
+    users_path = os.path.join(data_store.current_dir(), 'users.csv')
+    if not os.path.exists(users_path):
+        return []
+    try:
+        users_df = pd.read_csv(users_path)
+        return [str(u).strip() for u in users_df['username'].dropna().unique()]
+    except Exception as e:
+        print(f"Could not read usernames: {e}")
+        return []
+
+def _name_tokens(text):
+    """Lower-case words of a file or folder name, without a file extension."""
+    text = str(text).strip().lower()
+    if text.endswith(('.csv', '.xlsx', '.xls')):
+        text = os.path.splitext(text)[0]
+    return [t for t in re.split(r'[\s_\-.,()\[\]]+', text) if t]
+
+def _mentions(label_tokens, name_tokens):
+    """True if name_tokens appear as consecutive whole words of the label."""
+    n = len(name_tokens)
+    return n > 0 and any(label_tokens[i:i + n] == name_tokens for i in range(len(label_tokens) - n + 1))
+
+def grower_file_filter(username):
+    """
+    Returns an `only` predicate selecting the files a grower needs: users.csv, files
+    whose name or parent folder mentions the grower, and files that mention no
+    grower at all (they may hold anyone's rows, so they are always fetched).
+    Names are matched as whole words, so 'dan' does not match 'daniel_2024.csv'.
+    """
+    username = _name_tokens(username)
+    others = [_name_tokens(u) for u in _known_usernames()]
+    others = [u for u in others if u and u != username]
+
+    def only(f, inventory):
+        if _is_users_file(f):
+            return True
+        folder_names = {
+            g['name'] for g in inventory.get('files', [])
+            if g['id'] in f.get('parents', []) and g['mimeType'] == drive_cache.FOLDER_MIME
+        }
+        labels = [_name_tokens(label) for label in [f['name']] + list(folder_names)]
+        if any(_mentions(label, username) for label in labels):
+            return True
+        return not any(_mentions(label, other) for label in labels for other in others)
+    return only
+
+def fetch_users(creds=None):
+    """Lazy mode step 1: fetch only users.csv so login works."""
+    import sync_coordinator
+    return sync_coordinator.run_partial(lambda c: sync_data_api(c, only=_is_users_file), creds)
+
+def fetch_grower(creds, username, on_event=None):
+    """Lazy mode step 2: fetch only the logged-in grower's files."""
+    import sync_coordinator
+    only = grower_file_filter(username)
+    return sync_coordinator.run_partial(lambda c, on_event=None: sync_data_api(c, on_event=on_event, only=only),
+                                        creds, on_event=on_event)
+
+_backfill_lock = threading.Lock()
+_backfill_thread = None
+
+def start_backfill(creds=None):
+    """Lazy mode step 3: full sync in a background thread (once per process)."""
+    global _backfill_thread
+    import sync_coordinator
+    with _backfill_lock:
+        if _backfill_thread is not None and _backfill_thread.is_alive():
+            return _backfill_thread
+        _backfill_thread = threading.Thread(
+            target=sync_coordinator.run_sync, kwargs={'creds': creds, 'fresh_seconds': 0},
+            name='npk-backfill', daemon=True
+        )
+        _backfill_thread.start()
+        return _backfill_thread
+
+def _sheet_cache_note(telemetry):
+    """' Sheet export cache: x/y hits (z%).' for the result message (empty if no sheets)."""
+    hits = telemetry.counters.get('sheet_cache_hits', 0)
+    total = hits + telemetry.counters.get('sheet_cache_misses', 0)
+    if not total:
+        return ""
+    return f" Sheet export cache: {hits}/{total} hits ({hits * 100 // total}%)."
+
+def download_file(service, file_id, file_name, dest_folder=LOCAL_DATA_DIR, file_meta=None, telemetry=None, on_progress=None):
+    """
+    Downloads a file from Drive (every chunk goes through the drive_api retry engine).
+    on_progress(bytes_done, bytes_total) is called after each chunk. Returns the byte count.
+    """
+    is_sheet = bool(file_meta) and file_meta.get('mimeType') == 'application/vnd.google-apps.spreadsheet'
+    if is_sheet:
+         # Force .csv extension if missing
+         if not file_name.lower().endswith('.csv'):
+             file_name += '.csv'
+
+         # Exports are slow and count against quota: reuse the last export of this revision
+         cached_path = sheet_cache.lookup(file_meta)
+         if cached_path:
+             t_write = time.perf_counter()
+             nbytes = sheet_cache.copy_to(cached_path, os.path.join(dest_folder, file_name))
+             if telemetry:
+                 telemetry.count('sheet_cache_hits')
+                 telemetry.record_file(file_name, nbytes=nbytes, write_seconds=time.perf_counter() - t_write)
+             print(f"Export cache hit: {file_name}")
+             if on_progress:
+                 on_progress(nbytes, nbytes)
+             return nbytes
+
+         # Export Google Sheet as CSV
+         request = service.files().export_media(fileId=file_id, mimeType='text/csv')
+    else:
+         # Standard download
+         request = service.files().get_media(fileId=file_id)
+
+    retries = [0]
+    def count_retry(error, attempt, delay):
+        retries[0] += 1
+        if telemetry:
+            telemetry.event('retry', file=file_name, attempt=attempt, delay=round(delay, 3), error=str(error)[:200])
+
+    t_start = time.perf_counter()
+    try:
+        fh = io.BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while done is False:
+            # A failed chunk is retried from where it left off
+            status, done = drive_api.call(downloader.next_chunk, on_retry=count_retry)
+            if on_progress and status:
+                on_progress(status.resumable_progress, status.total_size)
+    except Exception as e:
+        print(f"Failed to download {file_name}: {e}")
+        if telemetry:
+            telemetry.record_file(file_name, download_seconds=time.perf_counter() - t_start,
+                                  retries=retries[0], status='failed', error=e)
+        raise
+    download_seconds = time.perf_counter() - t_start
+
+    # Save to disk
+    t_write = time.perf_counter()
+    # Never in place: dest may be a hardlink shared with an older snapshot (see data_store.carry_forward)
+    write_file(os.path.join(dest_folder, file_name), fh.getbuffer())
+    nbytes = fh.getbuffer().nbytes
+    if is_sheet:
+        sheet_cache.store(file_meta, fh.getvalue())
+        if telemetry:
+            telemetry.count('sheet_cache_misses')
+    if telemetry:
+        telemetry.record_file(file_name, nbytes=nbytes, download_seconds=download_seconds,
+                              write_seconds=time.perf_counter() - t_write, retries=retries[0])
+    print(f"Downloaded: {file_name}")
+    return nbytes
 
 if __name__ == "__main__":
-    sync_data()
+    # Go through the coordinator so a CLI run never overlaps a sync started by the app
+    import sync_coordinator
+    tracker = sync_telemetry.ProgressTracker()
+    def print_progress(event):
+        line = tracker.update(event)
+        if line:
+            print(line)
+    print(sync_coordinator.run_sync(on_event=print_progress))
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+# Configuration
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+EVENTS_FILE = os.path.join(CACHE_DIR, 'sync_events.jsonl')
+SUMMARY_FILE = os.path.join(CACHE_DIR, 'sync_summary.json')
+# The event log is rotated to EVENTS_FILE + '.1' (replacing the previous one) past this size
+MAX_EVENTS_BYTES = 5 * 1024 * 1024
+
+_write_lock = threading.Lock()
+
+
+def _rotate_events():
+    """Keeps the event log under MAX_EVENTS_BYTES (call with _write_lock held)."""
+    try:
+        if os.path.getsize(EVENTS_FILE) > MAX_EVENTS_BYTES:
+            os.replace(EVENTS_FILE, EVENTS_FILE + '.1')
+    except FileNotFoundError:
+        pass
+
+
+class SyncTelemetry:
+    """Collects structured timings for one sync run and appends them to a JSON-lines log."""
+
+    def __init__(self, source):
+        self.source = source
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.list_seconds = 0.0
+        self.list_calls = 0
+        self.retries = 0
+        self.files = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.event('start')
+
+    def event(self, kind, **fields):
+        """Appends one event line to the log."""
+        record = {'ts': time.time(), 'run_id': self.run_id, 'source': self.source, 'event': kind}
+        record.update(fields)
+        try:
+            with _write_lock:
+                if not os.path.exists(CACHE_DIR):
+                    os.makedirs(CACHE_DIR)
+                _rotate_events()
+                with open(EVENTS_FILE, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+        except Exception as e:
+            print(f"Could not write sync telemetry: {e}")
+
+    def on_retry(self, error, attempt, delay):
+        """Retry callback for drive_api (installed with drive_api.retry_listener; counts run-level retries)."""
+        with self.lock:
+            self.retries += 1
+        self.event('retry', attempt=attempt, delay=round(delay, 3), error=str(error)[:200])
+
+    def count(self, key, n=1):
+        """Increments a named counter (e.g. cache hits)."""
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def record_list(self, seconds, calls=1):
+        with self.lock:
+            self.list_seconds += seconds
+            self.list_calls += calls
+        self.event('list', seconds=round(seconds, 4), calls=calls)
+
+    def record_file(self, name, nbytes=0, download_seconds=0.0, write_seconds=0.0, retries=0, status='ok', error=None):
+        entry = {
+            'name': name,
+            'bytes': nbytes,
+            'download_seconds': round(download_seconds, 4),
+            'write_seconds': round(write_seconds, 4),
+            'retries': retries,
+            'status': status,
+        }
+        if error:
+            entry['error'] = str(error)[:200]
+        with self.lock:
+            self.files.append(entry)
+        self.event('file', **entry)
+
+    def finish(self, success, message=''):
+        """Builds the run summary, logs it and stores it as the latest summary."""
+        wall = time.perf_counter() - self._t0
+        with self.lock:
+            files = list(self.files)
+        total_bytes = sum(f['bytes'] for f in files)
+        summary = {
+            'run_id': self.run_id,
+            'source': self.source,
+            'started_at': self.started_at,
+            'finished_at': time.time(),
+            'success': bool(success),
+            'message': message,
+            'wall_seconds': round(wall, 3),
+            'list_seconds': round(self.list_seconds, 3),
+            'list_calls': self.list_calls,
+            'download_seconds': round(sum(f['download_seconds'] for f in files), 3),
+            'write_seconds': round(sum(f['write_seconds'] for f in files), 3),
+            'files_transferred': sum(1 for f in files if f['status'] == 'ok'),
+            'files_skipped': sum(1 for f in files if f['status'] == 'skipped'),
+            'files_failed': sum(1 for f in files if f['status'] == 'failed'),
+            'bytes': total_bytes,
+            'throughput_bps': round(total_bytes / wall, 1) if wall > 0 else 0.0,
+            'retries': self.retries + sum(f['retries'] for f in files),
+            'counters': dict(self.counters),
+            'files': files,
+        }
+        self.event('summary', **{k: v for k, v in summary.items() if k != 'files'})
+        try:
+            with _write_lock:
+                if not os.path.exists(CACHE_DIR):
+                    os.makedirs(CACHE_DIR)
+                tmp_path = SUMMARY_FILE + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(summary, f)
+                os.replace(tmp_path, SUMMARY_FILE)
+        except Exception as e:
+            print(f"Could not write sync summary: {e}")
+        print(f"Sync summary: {format_summary(summary)}")
+        return summary
+
+
+def load_latest_summary():
+    """Returns the summary of the most recent sync run, or None."""
+    if not os.path.exists(SUMMARY_FILE):
+        return None
+    try:
+        with open(SUMMARY_FILE, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _format_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024.0
+
+
+def format_summary(summary):
+    """One-line human readable version of a summary."""
+    if not summary:
+        return "No sync recorded yet."
+    when = time.strftime('%d/%m/%y %H:%M', time.localtime(summary.get('finished_at', 0)))
+    text = (
+        f"{when} ({summary.get('source')}): {summary.get('files_transferred', 0)} files, "
+        f"{_format_bytes(summary.get('bytes', 0))} in {summary.get('wall_seconds', 0):.1f}s "
+        f"({_format_bytes(summary.get('throughput_bps', 0))}/s)"
+    )
+    if summary.get('files_skipped'):
+        text += f", {summary['files_skipped']} unchanged"
+    if summary.get('files_failed'):
+        text += f", {summary['files_failed']} failed"
+    if summary.get('retries'):
+        text += f", {summary['retries']} retries"
+    return text
+
+
+def emitter(on_event):
+    """
+    Wraps an optional on_event callback: emit('phase', phase='listing'). Sync progress events:
+      {'type': 'phase', 'phase': 'listing' | 'downloading' | 'publishing' | 'icons' | 'waiting'}
+      {'type': 'discovered', 'files': n, 'bytes': known_total}
+      {'type': 'file_start', 'name', 'index', 'total', 'size'}
+      {'type': 'progress', 'name', 'bytes_done', 'bytes_total'}
+      {'type': 'file_done', 'name', 'bytes'}
+      {'type': 'failure', 'name', 'error'}
+      {'type': 'done', 'success', 'message'}   (always last)
+    """
+    def emit(kind, **fields):
+        if on_event is None:
+            return
+        event = {'type': kind, 'ts': time.time()}
+        event.update(fields)
+        try:
+            on_event(event)
+        except Exception as e:
+            print(f"Progress listener failed: {e}")
+    return emit
+
+
+class ProgressTracker:
+    """Turns sync progress events (see emitter) into a fraction, an ETA and status lines."""
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.phase = None
+        self.total_files = 0
+        self.files_done = 0
+        self.failures = 0
+        self.bytes_done = 0
+        self.current = None
+        self.current_fraction = 0.0
+        self.finished = False
+
+    @property
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        if not self.total_files:
+            return 0.0
+        return min(1.0, (self.files_done + self.current_fraction) / self.total_files)
+
+    def eta_seconds(self):
+        """Seconds left, extrapolated from the time spent so far (None until measurable)."""
+        fraction = self.fraction
+        if fraction <= 0 or fraction >= 1:
+            return None
+        elapsed = time.perf_counter() - self._t0
+        return elapsed / fraction * (1 - fraction)
+
+    def status_line(self):
+        text = f"[{self.phase or 'starting'}] {self.files_done}/{self.total_files} files, {_format_bytes(self.bytes_done)}"
+        if self.failures:
+            text += f", {self.failures} failed"
+        eta = self.eta_seconds()
+        if eta is not None:
+            text += f", ~{eta:.0f}s left"
+        return text
+
+    def update(self, event):
+        """Consumes one event; returns a line worth printing, or None."""
+        kind = event.get('type')
+        if kind == 'phase':
+            self.phase = event['phase']
+            return f"[{self.phase}]"
+        if kind == 'discovered':
+            self.total_files = event.get('files', 0)
+            return f"Found {self.total_files} files to sync."
+        if kind == 'file_start':
+            self.current = event['name']
+            self.current_fraction = 0.0
+            return None
+        if kind == 'progress':
+            if event.get('bytes_total'):
+                self.current_fraction = min(1.0, event['bytes_done'] / event['bytes_total'])
+            return None
+        if kind == 'file_done':
+            if self.phase == 'icons':
+                return f"Icon: {event['name']}"
+            self.files_done += 1
+            self.bytes_done += event.get('bytes') or 0
+            self.current_fraction = 0.0
+            return f"{self.status_line()} - {event['name']}"
+        if kind == 'failure':
+            self.files_done += 1
+            self.failures += 1
+            self.current_fraction = 0.0
+            return f"{self.status_line()} - FAILED {event['name']}: {event.get('error')}"
+        if kind == 'done':
+            self.finished = True
+            return f"Done in {time.perf_counter() - self._t0:.1f}s: {event.get('message')}"
+        return None